@@ -0,0 +1,114 @@
+import os
+import io
+import gzip
+from collections import Counter, namedtuple
+from xml.sax.saxutils import quoteattr
+import xml.etree.ElementTree as ET      # This is used to parse the XML files with the transcriptions
+import metrics
+
+# One "tau" segment (more or less equal to a sentence) with its timestamps, its words and the speaker. When asked for,
+# the element itself is kept as XML as well, so a split annotation keeps all the attributes of the "tau" and "tw"
+# elements (like ref and the timestamps of the words).
+Tau = namedtuple("Tau", ["tb", "te", "words", "speaker", "xml"], defaults=(None,))
+
+
+# This function opens the annotation in binary mode, so the parser can use the encoding given in the XML itself.
+# Zipped files are decompressed on the fly.
+def open_annotation(trans_path):
+    if trans_path.endswith(".gz"):
+        return gzip.open(trans_path, "rb")
+    return open(trans_path, "rb")
+
+
+# This generator streams over all the "tau" segments in an annotation without building the full tree.
+# Every element is cleared once it has been handled, so memory does not grow with the size of the file.
+# Only split_cgn.py writes the segments out again, so only it keeps their XML (keep_xml), which costs more than parsing.
+def iter_taus(trans_path, keep_xml=False):
+    with open_annotation(trans_path) as trans_file:
+        yield from stream_taus(trans_file, keep_xml)
+
+
+# This generator does the parsing for iter_taus, on an annotation that is already opened (in binary mode)
+def stream_taus(trans_file, keep_xml=False):
+    root = None
+    words = []
+    for event, elem in ET.iterparse(trans_file, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            continue
+
+        # All words are inside tags <tw .....>
+        if elem.tag == "tw":
+            words.append(elem.get("w"))
+        elif elem.tag == "tau":
+            xml = None
+            if keep_xml:
+                elem.tail = None  # Only the element itself, not the whitespace after it
+                xml = ET.tostring(elem, encoding="unicode")
+            yield Tau(float(elem.get("tb")), float(elem.get("te")), tuple(words), elem.get("s"), xml)
+            words = []
+            root.clear()  # Drop everything we have already seen
+
+
+# This function reads all the "tau" segments of an annotation in a list
+def read_taus(trans_path, keep_xml=False):
+    with metrics.timer("annotation_parse"):
+        return list(iter_taus(trans_path, keep_xml))
+
+
+# This function reads the (decompressed) content of an annotation, without parsing it
+def read_bytes(trans_path):
+    with metrics.timer("annotation_read"), open_annotation(trans_path) as trans_file:
+        return trans_file.read()
+
+
+# This function parses the content of an annotation that was read with read_bytes
+def parse_taus(data, keep_xml=False):
+    with metrics.timer("annotation_parse"):
+        return list(stream_taus(io.BytesIO(data), keep_xml))
+
+
+# This function checks if any of the given "tau" segments overlaps with the previous one (or ends before it begins)
+def is_overlapping(taus):
+    end = 0
+    for tau in taus:
+        if not end <= tau.tb < tau.te:
+            return True
+        end = tau.te
+    return False
+
+
+# This function returns the speaker of most of the given "tau" segments, or None if no speaker is known
+def main_speaker(taus):
+    speakers = Counter(tau.speaker for tau in taus if tau.speaker)
+    if not speakers:
+        return None
+    return speakers.most_common(1)[0][0]
+
+
+# This function writes the given "tau" segments to a new (extracted) annotation file.
+# We write to a temporary file first and rename it, so a crash never leaves a half written annotation behind.
+def write_taus(trans_path, taus):
+    with metrics.timer("annotation_write"):
+        write_file(trans_path, taus)
+
+
+# This function does the actual writing for write_taus
+def write_file(trans_path, taus):
+    temp_path = trans_path + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?>\n<transcription>')
+        for tau in taus:
+            if tau.xml is not None:
+                f.write(tau.xml)
+                continue
+            f.write("<tau")
+            if tau.speaker is not None:
+                f.write(" s=" + quoteattr(tau.speaker))
+            f.write(' tb="' + str(tau.tb) + '" te="' + str(tau.te) + '">')
+            for word in tau.words:
+                f.write("<tw w=" + quoteattr(word) + "/>")
+            f.write("</tau>")
+        f.write("</transcription>")
+    os.replace(temp_path, trans_path)
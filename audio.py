@@ -0,0 +1,231 @@
+import os
+import io
+import struct
+from collections import namedtuple
+import numpy as np
+import soundfile as sf  # This module is used to read and write parts of the sound files
+import metrics
+
+# The information we need from the header of a WAV file. The format tag is None if the header could not be parsed by us.
+WavInfo = namedtuple("WavInfo", ["frames", "samplerate", "channels", "format_tag", "bits_per_sample"])
+
+
+# The dtype we read each subtype in, so that the segments are written back without any conversion
+DTYPES = {
+    "PCM_S8": "int16",
+    "PCM_U8": "int16",
+    "PCM_16": "int16",
+    "PCM_24": "int32",
+    "PCM_32": "int32",
+    "ULAW": "int16",
+    "ALAW": "int16",
+    "FLOAT": "float32",
+    "DOUBLE": "float64",
+}
+
+# The format the segments are converted to: the sample rate, the number of channels and the sample width in bytes.
+# A field that is None is kept as it is in the original recording.
+AudioFormat = namedtuple("AudioFormat", ["samplerate", "channels", "sample_width"])
+
+# The subtype we write for every sample width
+SUBTYPES = {1: "PCM_U8", 2: "PCM_16", 3: "PCM_24", 4: "PCM_32"}
+
+# A recording that was decoded completely, as the reader stage of a pipeline passes it on. It can be used in the place
+# of an opened file in to_frame and needs_conversion.
+Decoded = namedtuple("Decoded", ["data", "samplerate", "channels", "subtype", "frames"])
+
+
+# This function opens a recording. Only the header is read here, the samples are read per segment later on.
+# Raises an error if the codec of the file is not supported.
+def open_audio(audio_path):
+    return sf.SoundFile(audio_path)
+
+
+# This function converts a timestamp in seconds to a frame offset in the given recording.
+# The recording can either be an opened file or the WavInfo of its header.
+def to_frame(audio_file, seconds):
+    return min(int(round(seconds * audio_file.samplerate)), audio_file.frames)
+
+
+# This function reads the samples between begin and end (in seconds) from an opened recording, converted to the target
+# format. It returns the samples, their sample rate and the subtype they should be written in.
+def read_segment(audio_file, begin, end, target=None):
+    start_frame = to_frame(audio_file, begin)
+    end_frame = to_frame(audio_file, end)
+    return read_converted(audio_file, start_frame, max(end_frame - start_frame, 0), target)
+
+
+# This function reads num_frames frames starting at start_frame from an opened recording and converts them to the target
+# format in the same pass. It returns the samples, their sample rate and the subtype they should be written in.
+# When the recording already has the target format the samples are read as they are, without any conversion.
+def read_converted(audio_file, start_frame, num_frames, target=None):
+    if not needs_conversion(audio_file, target):
+        return read_frames(audio_file, start_frame, num_frames), audio_file.samplerate, audio_file.subtype
+
+    return convert(read_frames(audio_file, start_frame, num_frames, dtype="float32"), audio_file, target)
+
+
+# This function converts float samples of the given recording to the target format. It returns the samples, their
+# sample rate and the subtype they should be written in.
+def convert(data, audio_file, target):
+    with metrics.timer("audio_convert"):
+        data = convert_channels(data, target.channels or audio_file.channels)
+        samplerate = target.samplerate or audio_file.samplerate
+        data = resample(data, audio_file.samplerate, samplerate)
+        # Resampling can overshoot a little, which would wrap around when it is written as integers
+        np.clip(data, -1, 1, out=data)
+    subtype = SUBTYPES[target.sample_width] if target.sample_width else audio_file.subtype
+    return data, samplerate, subtype
+
+
+# This function decodes a complete recording, in the dtype of the file
+def decode_all(audio_path):
+    with open_audio(audio_path) as audio_file:
+        data = read_frames(audio_file, 0, audio_file.frames)
+        return Decoded(data, audio_file.samplerate, audio_file.channels, audio_file.subtype, audio_file.frames)
+
+
+# This function is read_segment for a decoded recording: the samples are a view on the decoded ones, unless they have to
+# be converted to the target format
+def cut_segment(decoded, begin, end, target=None):
+    start_frame = to_frame(decoded, begin)
+    end_frame = max(to_frame(decoded, end), start_frame)
+    data = decoded.data[start_frame:end_frame]
+    if not needs_conversion(decoded, target):
+        return data, decoded.samplerate, decoded.subtype
+    return convert(to_float(data), decoded, target)
+
+
+# This function scales integer samples to floats between -1 and 1, the way soundfile does it when reading floats
+def to_float(data):
+    if data.dtype.kind != "i":
+        return data.astype(np.float32)
+    return data.astype(np.float32) / (np.iinfo(data.dtype).max + 1)
+
+
+# This function checks if the recording has to be converted to get the target format
+def needs_conversion(audio_file, target):
+    if target is None:
+        return False
+    return (target.samplerate not in (None, audio_file.samplerate)
+            or target.channels not in (None, audio_file.channels)
+            or (target.sample_width is not None and SUBTYPES[target.sample_width] != audio_file.subtype))
+
+
+# This function mixes the channels down to mono, or copies a mono channel to the given number of channels
+def convert_channels(data, channels):
+    if data.shape[1] == channels:
+        return data
+    if channels == 1:
+        return data.mean(axis=1, keepdims=True)
+    if data.shape[1] == 1:
+        return np.repeat(data, channels, axis=1)
+    raise ValueError("Can not convert " + str(data.shape[1]) + " channels to " + str(channels) + " channels")
+
+
+# This function returns the number of frames a segment has after resampling it
+def resampled_length(num_frames, samplerate, new_samplerate):
+    return int(round(num_frames * new_samplerate / samplerate))
+
+
+# This function resamples all the channels of a segment at once, in the frequency domain: the spectrum is cut off (or
+# padded) at the new Nyquist frequency, which is also the low-pass filter that prevents aliasing.
+def resample(data, samplerate, new_samplerate):
+    if samplerate == new_samplerate or len(data) == 0:
+        return data
+    new_length = resampled_length(len(data), samplerate, new_samplerate)
+    spectrum = np.fft.rfft(data, axis=0)
+    new_spectrum = np.zeros((new_length // 2 + 1, data.shape[1]), dtype=spectrum.dtype)
+    keep = min(len(spectrum), len(new_spectrum))
+    new_spectrum[:keep] = spectrum[:keep]
+    return (np.fft.irfft(new_spectrum, new_length, axis=0) * (new_length / len(data))).astype(np.float32)
+
+
+# This function reads num_frames frames starting at start_frame from an opened recording.
+# We seek to the first frame and only read the frames we need, so memory is bounded by the segment size.
+# Without a dtype the samples are read in the dtype of the file, so they can be written back without any conversion.
+def read_frames(audio_file, start_frame, num_frames, dtype=None):
+    with metrics.timer("audio_decode"):
+        audio_file.seek(start_frame)
+        if dtype is None:
+            dtype = DTYPES.get(audio_file.subtype, "float32")
+        return audio_file.read(num_frames, dtype=dtype, always_2d=True)
+
+
+# This function writes a segment to a new file with the given sample rate and subtype.
+# We write to a temporary file first and rename it, so a crash never leaves a half written segment behind.
+def write_segment(new_audio_path, data, samplerate, subtype):
+    temp_path = new_audio_path + ".part"
+    with metrics.timer("audio_write"):
+        sf.write(temp_path, data, samplerate, subtype=subtype, format="WAV")
+        os.replace(temp_path, new_audio_path)
+
+
+# The format tag and the bits per sample soundfile writes in the header of a WAV file, for every subtype we write
+WAV_FORMATS = {"PCM_U8": (1, 8), "PCM_16": (1, 16), "PCM_24": (1, 24), "PCM_32": (1, 32), "FLOAT": (3, 32),
+               "DOUBLE": (3, 64)}
+
+
+# This function returns the header information of a segment written by write_segment, without reading the file back.
+# It returns None for a subtype whose header we do not know.
+def segment_info(data, samplerate, subtype):
+    if subtype not in WAV_FORMATS:
+        return None
+    format_tag, bits_per_sample = WAV_FORMATS[subtype]
+    return WavInfo(len(data), samplerate, 1 if data.ndim == 1 else data.shape[1], format_tag, bits_per_sample)
+
+
+# This function encodes a segment as a complete WAV file in memory
+def encode_wav(data, samplerate, subtype):
+    buffer = io.BytesIO()
+    sf.write(buffer, data, samplerate, subtype=subtype, format="WAV")
+    return buffer.getvalue()
+
+
+# This function reads the length and format of a WAV file from its RIFF header only, without reading the samples.
+# Files we can not make sense of (no RIFF header, no "data" chunk, ...) are handed to soundfile instead.
+def probe_wav(audio_path):
+    with metrics.timer("wav_probe"):
+        return read_header(audio_path)
+
+
+# This function does the actual parsing for probe_wav
+def read_header(audio_path):
+    with open(audio_path, "rb") as f:
+        header = f.read(12)
+        fmt = None
+        if len(header) == 12 and header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+            # Walk over the chunks until we find the "data" chunk, skipping the content of every chunk
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    break
+                chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+                if chunk_id == b"fmt ":
+                    fmt = struct.unpack("<HHIIHH", f.read(16))
+                    f.seek(chunk_size - 16 + chunk_size % 2, 1)
+                elif chunk_id == b"data" and fmt is not None:
+                    format_tag, channels, samplerate, _, block_align, bits_per_sample = fmt
+                    if block_align == 0 or chunk_size == 0xFFFFFFFF:
+                        break
+                    # A file that was cut off can claim more data than there is
+                    data_size = min(chunk_size, os.fstat(f.fileno()).st_size - f.tell())
+                    return WavInfo(data_size // block_align, samplerate, channels, format_tag, bits_per_sample)
+                else:
+                    f.seek(chunk_size + chunk_size % 2, 1)
+
+    info = sf.info(audio_path)
+    return WavInfo(info.frames, info.samplerate, info.channels, None, None)
+
+
+# This function calculates the size a WAV file with num_frames frames in the format of the given header would have, after
+# it has been converted to the target format
+def wav_size(info, num_frames, target=None):
+    bytes_per_sample = ((info.bits_per_sample or 16) + 7) // 8
+    channels = info.channels
+    if target is not None:
+        if target.samplerate:
+            num_frames = resampled_length(num_frames, info.samplerate, target.samplerate)
+        channels = target.channels or channels
+        bytes_per_sample = target.sample_width or bytes_per_sample
+    return 44 + num_frames * channels * bytes_per_sample
@@ -0,0 +1,204 @@
+import os
+from os import path
+import sys
+import argparse
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+import audio
+
+# The directory with the scripts that are benchmarked
+SCRIPTS_DIR = path.dirname(path.abspath(__file__))
+
+BENCHMARK_FILE = "benchmark.json"
+TOLERANCE = 0.2  # A stage that is this much slower than in the baseline is a regression
+
+
+# The stages that are benchmarked, in order: the name, the script with its arguments and what counts as a file.
+# Every stage runs in the same working directory, so it finds the files the previous stages wrote.
+def get_stages(target, workers):
+    workers = str(workers)
+    return [
+        ("count_files (cold index)", ["count_files.py", target], "recordings"),
+        ("count_files (warm index)", ["count_files.py", target], "recordings"),
+        ("split_cgn --manifest", ["split_cgn.py", target, "--workers", workers, "--manifest", "segments.csv"],
+         "recordings"),
+        ("split_cgn", ["split_cgn.py", target, "--workers", workers], "recordings"),
+        ("import_cgn", ["import_cgn.py", target, "--workers", workers], "segments"),
+        ("import_cgn --manifest", ["import_cgn.py", target, "--manifest", "segments.csv"], "segments"),
+        ("clean_data", ["clean_data.py", "train_data_strip.csv"], "rows"),
+    ]
+
+
+def benchmark(args):
+    workdir = tempfile.mkdtemp(prefix="cgn_benchmark_")
+    target = args.target
+
+    # Generate a synthetic corpus if we were not given one
+    if target is None:
+        target = path.join(workdir, "corpus")
+        subprocess.run([sys.executable, path.join(SCRIPTS_DIR, "generate_corpus.py"), target,
+                        "--recordings", str(args.recordings), "--duration", str(args.duration)],
+                       check=True, stdout=subprocess.DEVNULL)
+    target = path.abspath(target)
+
+    recordings, hours = measure_corpus(target)
+    print("Benchmarking " + str(recordings) + " recordings with %.2f hours of audio in %s" % (hours, workdir))
+
+    use_strace = shutil.which("strace") is not None
+    if not use_strace:
+        print("strace is not installed, only the read and write system calls are counted")
+
+    results = []
+    for name, command, unit in get_stages(target, args.workers):
+        # The number of files a stage processes is only known once the stages before it ran
+        if unit == "recordings":
+            files = recordings
+        elif unit == "segments":
+            files = count_segments(target)
+        else:
+            files = count_rows(path.join(workdir, command[1]))
+
+        result = run_stage(name, command, workdir, use_strace)
+        result["files"] = files
+        result["files_per_second"] = files / result["seconds"]
+        result["audio_hours_per_second"] = hours / result["seconds"] if unit != "rows" else None
+        results.append(result)
+        print_result(result)
+
+    with open(args.output, "w") as f:
+        json.dump({"recordings": recordings, "hours": hours, "workers": args.workers, "stages": results}, f, indent=2)
+    print("Written the results to " + args.output)
+
+    if not args.keep:
+        shutil.rmtree(workdir)
+
+    if args.baseline:
+        return compare(results, args.baseline, args.tolerance)
+    return 0
+
+
+# This function counts the original recordings and their hours of audio, from the headers only
+def measure_corpus(target):
+    recordings = 0
+    seconds = 0
+    for root, _, files in os.walk(path.join(target, "data/audio/wav")):
+        for file in files:
+            if file.endswith(".wav") and "(" not in file:
+                info = audio.probe_wav(path.join(root, file))
+                recordings += 1
+                seconds += info.frames / info.samplerate
+    return recordings, seconds / 3600
+
+
+# This function counts the segments split_cgn.py wrote
+def count_segments(target):
+    return sum(1 for _, _, files in os.walk(path.join(target, "data/audio/wav"))
+               for file in files if file.endswith(".wav") and "(" in file)
+
+
+# This function counts the rows of a CSV file, without the header
+def count_rows(csv_file):
+    if not path.exists(csv_file):
+        return 0
+    with open(csv_file) as f:
+        return max(sum(1 for _ in f) - 1, 0)
+
+
+# This function reads the I/O counters of this process. The counters of the children we waited for are added to them.
+def read_io():
+    with open("/proc/self/io") as f:
+        return {key: int(value) for key, value in (line.split(": ") for line in f.read().splitlines())}
+
+
+# This function runs one stage in a new process and measures its time, peak memory and system calls
+def run_stage(name, command, workdir, use_strace):
+    log_file = path.join(workdir, name.split()[0] + ".log")
+    strace_file = path.join(workdir, "strace.txt")
+    cmd = [sys.executable, path.join(SCRIPTS_DIR, command[0])] + command[1:]
+    if use_strace:
+        cmd = ["strace", "-f", "-c", "-o", strace_file] + cmd
+
+    before = read_io()
+    start = time.perf_counter()
+    with open(log_file, "a") as log:
+        process = subprocess.Popen(cmd, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 gives us the resource usage of the stage and all the processes it waited for
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    seconds = time.perf_counter() - start
+    after = read_io()
+
+    if process.returncode != 0:
+        raise RuntimeError("Stage " + name + " failed, see " + log_file)
+
+    result = {
+        "stage": name,
+        "seconds": seconds,
+        "peak_rss_mb": rusage.ru_maxrss / 1024,
+        "read_syscalls": after["syscr"] - before["syscr"],
+        "write_syscalls": after["syscw"] - before["syscw"],
+        "read_bytes": after["rchar"] - before["rchar"],
+        "written_bytes": after["wchar"] - before["wchar"],
+        "syscalls": read_strace_total(strace_file) if use_strace else None,
+    }
+    return result
+
+
+# This function reads the total number of system calls from the summary of strace -c
+def read_strace_total(strace_file):
+    with open(strace_file) as f:
+        for line in f:
+            fields = line.split()
+            if fields and fields[-1] == "total":
+                return int(fields[3])
+    return None
+
+
+def print_result(result):
+    print("%-26s %8.2f s  %9.1f files/s  %s audio-h/s  %7.1f MB  %9d reads  %9d writes  %s syscalls" % (
+        result["stage"], result["seconds"], result["files_per_second"],
+        "%8.3f" % result["audio_hours_per_second"] if result["audio_hours_per_second"] is not None else "     n/a",
+        result["peak_rss_mb"], result["read_syscalls"], result["write_syscalls"],
+        result["syscalls"] if result["syscalls"] is not None else "n/a"))
+
+
+# This function compares the results with a baseline and returns 1 if a stage got slower than the tolerance allows
+def compare(results, baseline_file, tolerance):
+    with open(baseline_file) as f:
+        baseline = {stage["stage"]: stage for stage in json.load(f)["stages"]}
+
+    regressions = 0
+    for result in results:
+        old = baseline.get(result["stage"])
+        if old is None:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        if ratio > 1 + tolerance:
+            print("Regression in %s: %.2f s instead of %.2f s (%.0f%% slower)"
+                  % (result["stage"], result["seconds"], old["seconds"], (ratio - 1) * 100))
+            regressions += 1
+
+    print("Found " + str(regressions) + " regressions compared to " + baseline_file)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    print("Starting the benchmark")
+
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", nargs="?",
+                        help="the top level directory of a (synthetic) corpus, if not given one is generated")
+    parser.add_argument("--recordings", type=int, default=5, help="the recordings per component and language to generate")
+    parser.add_argument("--duration", type=float, default=300, help="the average length of a generated recording")
+    parser.add_argument("--workers", type=int, default=1, help="the number of workers the stages may use")
+    parser.add_argument("--output", default=BENCHMARK_FILE, help="the JSON file the results are written to")
+    parser.add_argument("--baseline", help="a JSON file of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="the allowed slowdown compared to the baseline")
+    parser.add_argument("--keep", action="store_true", help="keep the working directory with the outputs and logs")
+    args = parser.parse_args()
+
+    sys.exit(benchmark(args))
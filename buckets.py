@@ -0,0 +1,104 @@
+import os
+from os import path
+import argparse
+import numpy as np
+import pandas as pd
+import metrics
+
+# The ways the rows of a split can be ordered by their length: all sorted from short to long, or grouped in buckets of
+# BUCKET_WIDTH seconds (keeping the order of the rows inside a bucket)
+ORDERS = ["sorted", "bucketed"]
+BUCKET_WIDTH = 1.0
+
+# The default file with the number of files and hours of audio of every bucket of every split
+HISTOGRAM_FILE = "duration_histogram.csv"
+
+
+# This function returns the name of the ordered file of a split, e.g. train_data_strip.sorted.csv
+def ordered_file(csv_file, order):
+    root, extension = path.splitext(csv_file)
+    return root + "." + order + extension
+
+
+# This function returns the bucket of every duration: bucket k holds the durations in [k * width, (k + 1) * width)
+def bucket_of(durations, width=BUCKET_WIDTH):
+    return np.floor(np.asarray(durations, dtype=np.float64) / width).astype(np.int64)
+
+
+# This function reads a split written by import_cgn.py. It returns None when the split has no durations, because it was
+# written before they were added.
+def read_split(csv_file):
+    df = pd.read_csv(csv_file, keep_default_na=False)
+    if "duration" not in df.columns:
+        metrics.log("There are no durations in " + csv_file + ", import it again to order it")
+        return None
+    return df
+
+
+# This function writes the rows of a split ordered by their length to a new file, and returns its name. Only the
+# columns of the split are read, so no audio file is opened.
+def order_split(csv_file, order, width=BUCKET_WIDTH):
+    df = read_split(csv_file)
+    if df is None:
+        return None
+
+    if order == "sorted":
+        df = df.sort_values("duration", kind="stable")
+    else:
+        df["bucket"] = bucket_of(df["duration"], width)
+        df = df.sort_values("bucket", kind="stable")
+
+    output_file = ordered_file(csv_file, order)
+    temp_file = output_file + ".part"
+    df.to_csv(temp_file, sep=',', index=False)
+    os.replace(temp_file, output_file)
+    return output_file
+
+
+# This function counts the files and the hours of audio in every bucket of every split.
+# It returns one row (split, begin and end of the bucket, files, hours) for every bucket that is not empty.
+def histogram(csv_files, width=BUCKET_WIDTH):
+    rows = []
+    for csv_file in csv_files:
+        df = read_split(csv_file)
+        if df is None:
+            continue
+        durations = df["duration"].to_numpy(dtype=np.float64)
+        buckets = bucket_of(durations, width)
+        for bucket in np.unique(buckets):
+            selected = durations[buckets == bucket]
+            rows.append((path.basename(csv_file), round(bucket * width, 6), round((bucket + 1) * width, 6),
+                         len(selected), round(selected.sum() / 3600, 3)))
+    return rows
+
+
+# This function prints the histogram and writes it to a CSV file
+def write_histogram(histogram_file, rows):
+    columns = ["split", "begin", "end", "files", "hours"]
+    metrics.log("%-28s %8s %8s %8s %8s" % tuple(columns))
+    for row in rows:
+        metrics.log("%-28s %8g %8g %8d %8.3f" % row)
+    pd.DataFrame(rows, columns=columns).to_csv(histogram_file, sep=',', index=False)
+    metrics.log("Written the histogram to " + histogram_file)
+
+
+# This function writes the ordered files and the histogram of the given splits
+def order_splits(csv_files, order, width=BUCKET_WIDTH, histogram_file=HISTOGRAM_FILE):
+    for csv_file in csv_files:
+        output_file = order_split(csv_file, order, width)
+        if output_file is not None:
+            metrics.log("Written the " + order + " rows of " + csv_file + " to " + output_file)
+    write_histogram(histogram_file, histogram(csv_files, width))
+
+
+if __name__ == "__main__":
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+", help="the CSV files written by import_cgn.py (or merged by merge_shards.py)")
+    parser.add_argument("--order", choices=ORDERS, default="sorted",
+                        help="sort the rows by their duration, or group them in buckets of --bucket-width seconds")
+    parser.add_argument("--bucket-width", type=float, default=BUCKET_WIDTH, help="the width of a bucket in seconds")
+    parser.add_argument("--histogram", default=HISTOGRAM_FILE, help="the CSV file the histogram is written to")
+    args = parser.parse_args()
+
+    order_splits(args.files, args.order, args.bucket_width, args.histogram)
@@ -1,28 +1,83 @@
 import argparse
 import pandas as pd
 from os import path
+import normalize
+import corpus_catalog
 
+# The number of rows that are cleaned at once
+CHUNK_SIZE = 100000
+
+# The rules are the replacements and drops of the normalization in the importer. CSV files written by import_cgn.py
+# already went through them, this script is only needed for CSV files written without them (import_cgn.py --no-clean).
+RULES = normalize.compile_rules(words=[], characters=[])
+
+
+# This function cleans one chunk of rows
+def clean_chunk(df, rules):
+    transcripts = df['transcript'].astype(str).str.translate(rules.table)
+    keep = ~transcripts.str.contains(rules.drop, na=False)
+    df = df[keep].copy()
+    df['transcript'] = transcripts[keep]
+    # The replacements can change the length of a transcript
+    if 'transcript_length' in df.columns:
+        df['transcript_length'] = df['transcript'].str.len()
+    return df
+
+
+# This function drops the rows whose audio file is not in the catalog (given as a set of absolute paths)
+def drop_missing(df, known):
+    return df[df['wav_filename'].map(path.abspath).isin(known)]
+
+
+# This function returns the name of the cleaned file of a CSV file, e.g. cleaned_train_data_strip.csv
+def cleaned_file(file):
+    return path.join(path.dirname(file), "cleaned_" + path.basename(file))
 
-def clean(args):
-    file = args.file
-    df = pd.read_csv(file)
-    print("There are " + str(len(df)) + " in the original file")
 
-    df['transcript'] = df['transcript'].str.replace("-", " ", regex=True)  # Replace - by a space
+# A catalog that was already scanned can be given, preprocess.py uses it for all the splits
+def clean(args, catalog=None):
+    file = args.file
 
-    # Iterate over all rows in the dataframe
-    for index, row in df.iterrows():
-        if row['transcript'].find('&') != -1:  # Drop all rows containing a &
-            df.drop(index, inplace=True)
+    original = 0
+    cleaned = 0
+    missing = 0
 
-    print("There are " + str(len(df)) + " in the cleaned file")
+    # The audio files that exist, when we have to check them
+    known = None
+    if catalog is None and (args.catalog or args.target):
+        catalog = corpus_catalog.get_catalog(args.target, args.catalog)
+    if catalog is not None:
+        known = set(path.abspath(r.audio_path) for r in catalog.recordings)
 
-    # We write the cleaned file
+    # We write the cleaned file chunk by chunk, so the memory used does not depend on the size of the file
     print("Writing cleaned file")
-    new_file = path.dirname(file) + "/cleaned_" + path.basename(file)
-    with open(new_file, 'a') as f:
-        # We only want to write the header the first time, hence the quick check "header = ..."
-        df.to_csv(f, sep=',', index=False, encoding="ascii")
+    new_file = cleaned_file(file)
+    with open(new_file, 'w') as f:
+        for chunk in pd.read_csv(file, chunksize=args.chunk_size):
+            original += len(chunk)
+            if known is not None:
+                found = len(chunk)
+                chunk = drop_missing(chunk, known)
+                missing += found - len(chunk)
+            chunk = clean_chunk(chunk, RULES)
+            cleaned += len(chunk)
+            # We only want to write the header the first time
+            chunk.to_csv(f, sep=',', index=False, header=f.tell() == 0)
+
+    print("There are " + str(original) + " in the original file")
+    print("There are " + str(cleaned) + " in the cleaned file")
+    if known is not None:
+        print("Dropped " + str(missing) + " rows whose audio file is missing")
+
+
+# This function builds the parser for the command line arguments, preprocess.py uses it for the defaults as well
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", help="the file that will be cleaned")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="the number of rows that are cleaned at once")
+    parser.add_argument("--target", help="drop the rows whose audio file is not in this corpus")
+    parser.add_argument("--catalog", help="drop the rows whose audio file is not in the catalog saved in this file")
+    return parser
 
 
 # The main function
@@ -30,10 +85,8 @@ if __name__ == "__main__":
     print("Starting the cleaning of the data")
 
     # Starting the parser for the command line arguments
-    parser = argparse.ArgumentParser()
-    parser.add_argument("file", help="the file that will be cleaned")
-    args = parser.parse_args()
+    args = get_parser().parse_args()
 
     clean(args)
 
-    print("Completed successfully")
\ No newline at end of file
+    print("Completed successfully")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+from os import path
+import argparse         # This module is used to pass optional flags to the script
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd     # Pandas is used to read the CSV files of the splits
+import audio
+import features         # This is used to compute the features and store them
+import import_cgn       # This is used for the names of the CSV files of the splits
+import metrics
+
+# The number of segments a worker computes the features of at once
+BATCH_SIZE = 64
+
+KINDS = ["logmel", "mfcc"]
+
+
+# This function computes the features of every segment in the given CSV files and stores them next to them
+def compute_features(args):
+    num_features = args.n_mfcc if args.kind == "mfcc" else args.n_mels
+    settings = (args.kind, args.n_mels, args.n_mfcc, args.window, args.hop)
+
+    executor = None
+    if args.workers > 1:
+        executor = ProcessPoolExecutor(max_workers=args.workers, initializer=metrics.configure,
+                                       initargs=(metrics.settings["quiet"], metrics.settings["verbose"]))
+    try:
+        for csv_file in args.csv:
+            if not path.exists(csv_file):
+                metrics.log("Could not find " + csv_file)
+                continue
+            data_file = features.feature_file(csv_file, args.kind)
+            writer = features.FeatureWriter(data_file, num_features)
+            tasks = ((batch, settings) for batch in read_batches(csv_file, args.batch_size))
+            # The results come back in the order of the batches, so the features are in the same order as the rows
+            results = executor.map(batch_task, tasks) if executor is not None else map(batch_task, tasks)
+            for batch_features, task_metrics in results:
+                metrics.merge(task_metrics)
+                for segment_features in batch_features:
+                    writer.add(segment_features)
+            writer.close()
+            metrics.count("segments", len(writer.offsets) - 1)
+            metrics.log("Written the features of " + str(len(writer.offsets) - 1) + " segments of " + csv_file
+                        + " to " + data_file)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+
+# This generator reads the rows of a CSV file written by import_cgn.py in batches. Every row is the file, and the first
+# frame and the number of frames when the rows come from a manifest (otherwise None).
+def read_batches(csv_file, batch_size):
+    for chunk in pd.read_csv(csv_file, chunksize=batch_size, keep_default_na=False):
+        if "start_frame" in chunk.columns:
+            yield list(zip(chunk["wav_filename"], chunk["start_frame"].astype(int), chunk["num_frames"].astype(int)))
+        else:
+            yield [(wav_filename, None, None) for wav_filename in chunk["wav_filename"]]
+
+
+# This function computes the features of one batch, together with the metrics of only this batch
+def batch_task(task):
+    return metrics.collect(process_batch, *task)
+
+
+# This function reads the segments of a batch and computes their features. Segments with the same sample rate are
+# computed together in one vectorized call.
+def process_batch(batch, settings):
+    kind, n_mels, n_mfcc, window, hop = settings
+    signals = []
+    audio_file = None
+    try:
+        for wav_filename, start_frame, num_frames in batch:
+            # Consecutive segments of the same recording share one opened file
+            if audio_file is None or audio_file.name != wav_filename:
+                if audio_file is not None:
+                    audio_file.close()
+                audio_file = audio.open_audio(wav_filename)
+            if start_frame is None:
+                start_frame, num_frames = 0, audio_file.frames
+            data = audio.read_frames(audio_file, start_frame, num_frames, dtype="float32")
+            signals.append((audio_file.samplerate, data.mean(axis=1)))  # Mix down to mono
+    finally:
+        if audio_file is not None:
+            audio_file.close()
+
+    result = [None] * len(signals)
+    for samplerate in sorted(set(rate for rate, _ in signals)):
+        positions = [i for i, (rate, _) in enumerate(signals) if rate == samplerate]
+        with metrics.timer("features"):
+            computed = features.compute_batch([signals[i][1] for i in positions], samplerate,
+                                              kind, n_mels, n_mfcc, window, hop)
+        for i, segment_features in zip(positions, computed):
+            result[i] = segment_features
+    return result
+
+
+if __name__ == "__main__":
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", nargs='+',
+                        default=[import_cgn.FILENAME_TRAIN, import_cgn.FILENAME_DEV, import_cgn.FILENAME_TEST],
+                        help="the CSV files written by import_cgn.py, the features are stored next to them")
+    parser.add_argument("--kind", choices=KINDS, default="logmel", help="the kind of features")
+    parser.add_argument("--n-mels", type=int, default=features.N_MELS, help="the number of mel bands")
+    parser.add_argument("--n-mfcc", type=int, default=features.N_MFCC, help="the number of MFCCs")
+    parser.add_argument("--window", type=float, default=features.WINDOW, help="the length of a frame in seconds")
+    parser.add_argument("--hop", type=float, default=features.HOP, help="the time between two frames in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="the number of processes computing features")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="the number of segments in a batch")
+    parser.add_argument("--quiet", action="store_true", help="only print the results")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every file")
+    parser.add_argument("--metrics", help="write the counters and timers to this JSON file")
+    args = parser.parse_args()
+
+    metrics.configure(args.quiet, args.verbose)
+    metrics.log("Starting the computation of the features")
+    compute_features(args)
+    metrics.summarize(args.metrics)
+    metrics.log("Completed successfully")
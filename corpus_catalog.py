@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import argparse
+import csv
+from collections import namedtuple
+import metrics
+
+# The default file a catalog is saved to
+CATALOG_FILE = "cgn_catalog.csv"
+
+AUDIO_DIR = "data/audio/wav"
+TRANS_DIR = "data/annot/xml/skp-ort"
+
+# The size and modification time of a file, the way os.stat gives them. They are taken once, while scanning.
+Stat = namedtuple("Stat", ["st_size", "st_mtime_ns"])
+
+# One recording (or one segment written by split_cgn.py) with its annotation. The annotation is None when there is none.
+Recording = namedtuple("Recording", ["component", "language", "name", "audio_path", "audio_stat", "trans_path",
+                                     "trans_stat"])
+
+# An annotation without a recording
+Annotation = namedtuple("Annotation", ["component", "language", "name", "trans_path"])
+
+COLUMNS = ["component", "language", "name", "audio_path", "audio_size", "audio_mtime_ns", "trans_path", "trans_size",
+           "trans_mtime_ns"]
+
+
+# This class holds all the recordings of a corpus with their annotations, found with one scan of the audio and the
+# annotation directories. Recordings without an annotation and annotations without a recording are kept apart, so
+# they can be reported before anything is done with them.
+class Catalog:
+    def __init__(self, target, recordings, orphan_annotations):
+        self.target = target
+        self.recordings = recordings
+        self.orphan_annotations = orphan_annotations
+
+    # The original recordings (not the segments) that have an annotation
+    def originals(self):
+        return [r for r in self.recordings if "(" not in r.name and r.trans_path is not None]
+
+    # The segments written by split_cgn.py that have an annotation
+    def segments(self):
+        return [r for r in self.recordings if "(" in r.name and r.trans_path is not None]
+
+    # The recordings (and segments) without an annotation
+    def orphan_recordings(self):
+        return [r for r in self.recordings if r.trans_path is None]
+
+    # The components and languages that were found, in order
+    def partitions(self):
+        return sorted(set((r.component, r.language) for r in self.recordings))
+
+    def audio_dir(self, component, language):
+        return path.join(self.target, AUDIO_DIR, component, language)
+
+    # This function prints how many files were found, and which files are missing their recording or annotation
+    def report(self):
+        orphans = self.orphan_recordings()
+        metrics.log("Found " + str(len(self.recordings)) + " recordings in " + str(len(self.partitions()))
+                    + " components and languages")
+        metrics.log("Recordings without an annotation: " + str(len(orphans)))
+        for recording in orphans:
+            metrics.detail("No annotation for " + recording.audio_path)
+        metrics.log("Annotations without a recording: " + str(len(self.orphan_annotations)))
+        for orphan in self.orphan_annotations:
+            metrics.detail("No recording for " + orphan.trans_path)
+
+    # This function saves the catalog to a CSV file, the orphaned annotations have no audio path
+    def save(self, catalog_file=CATALOG_FILE):
+        with open(catalog_file + ".part", "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerow(["target", "", "", self.target, "", "", "", "", ""])
+            for r in self.recordings:
+                trans = ("", "", "") if r.trans_path is None else (r.trans_path,) + tuple(r.trans_stat)
+                writer.writerow((r.component, r.language, r.name, r.audio_path) + tuple(r.audio_stat) + trans)
+            for a in self.orphan_annotations:
+                writer.writerow((a.component, a.language, a.name, "", "", "", a.trans_path, "", ""))
+        os.replace(catalog_file + ".part", catalog_file)
+
+
+# This function loads a catalog saved by Catalog.save
+def load(catalog_file=CATALOG_FILE):
+    recordings = []
+    orphan_annotations = []
+    with open(catalog_file, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)  # Skip the header
+        target = next(reader)[3]
+        for comp, lang, name, audio_path, audio_size, audio_mtime, trans_path, trans_size, trans_mtime in reader:
+            if not audio_path:
+                orphan_annotations.append(Annotation(comp, lang, name, trans_path))
+            elif not trans_path:
+                recordings.append(Recording(comp, lang, name, audio_path, Stat(int(audio_size), int(audio_mtime)),
+                                            None, None))
+            else:
+                recordings.append(Recording(comp, lang, name, audio_path, Stat(int(audio_size), int(audio_mtime)),
+                                            trans_path, Stat(int(trans_size), int(trans_mtime))))
+    return Catalog(target, recordings, orphan_annotations)
+
+
+# This function scans the corpus at the given target once: every directory is listed a single time with os.scandir and
+# every file is stat-ed once, for its size and modification time (on POSIX that is a call per file, only on Windows
+# they come with the listing). No file is opened, and the scripts use these stat results instead of looking up the
+# files again.
+def scan(target):
+    recordings = []
+    orphan_annotations = []
+    for comp in list_dirs(path.join(target, AUDIO_DIR), "comp"):
+        for lang in list_dirs(path.join(target, AUDIO_DIR, comp)):
+            audio_files = list_files(path.join(target, AUDIO_DIR, comp, lang), (".wav",))
+            trans_files = list_files(path.join(target, TRANS_DIR, comp, lang), (".skp", ".skp.gz"))
+            for name in sorted(audio_files):
+                audio_path, audio_stat = audio_files[name]
+                trans_path, trans_stat = trans_files.pop(name, (None, None))
+                recordings.append(Recording(comp, lang, name, audio_path, audio_stat, trans_path, trans_stat))
+            for name in sorted(trans_files):
+                orphan_annotations.append(Annotation(comp, lang, name, trans_files[name][0]))
+    return Catalog(target, recordings, orphan_annotations)
+
+
+# This function lists the subdirectories of a directory, in order
+def list_dirs(directory, prefix=""):
+    if not path.isdir(directory):
+        return []
+    with os.scandir(directory) as entries:
+        return sorted(entry.name for entry in entries if entry.is_dir() and entry.name.startswith(prefix))
+
+
+# This function lists the files with one of the given extensions in a directory, by their name without the extension.
+# When a name has more than one of the extensions the first one wins, so an extracted annotation (.skp) is used before
+# a zipped one (.skp.gz).
+def list_files(directory, extensions):
+    files = {}
+    if not path.isdir(directory):
+        return files
+    with os.scandir(directory) as entries:
+        found = [entry for entry in entries if entry.is_file()]
+    for extension in reversed(extensions):
+        for entry in found:
+            if entry.name.endswith(extension):
+                stat = entry.stat()
+                files[entry.name[:-len(extension)]] = (entry.path, Stat(stat.st_size, stat.st_mtime_ns))
+    return files
+
+
+# This function returns the name of the original recording of a file, e.g. fn000001 for .../fn000001(003).wav
+def recording_id(filename):
+    return path.basename(filename).split(".")[0].split("(")[0]
+
+
+# This function returns the catalog of a target: the saved one if a file is given, otherwise a new scan
+def get_catalog(target, catalog_file=None):
+    if catalog_file:
+        metrics.log("Using the catalog in " + catalog_file)
+        return load(catalog_file)
+    return scan(target)
+
+
+if __name__ == "__main__":
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="the top level target directory")
+    parser.add_argument("--output", default=CATALOG_FILE, help="the file the catalog is saved to")
+    parser.add_argument("--verbose", action="store_true", help="list the recordings and annotations without a pair")
+    args = parser.parse_args()
+
+    metrics.configure(verbose=args.verbose)
+    catalog = scan(args.target)
+    catalog.report()
+    catalog.save(args.output)
+    metrics.log("Written the catalog to " + args.output)
@@ -0,0 +1,177 @@
+import os
+from os import path
+import threading
+import sqlite3          # The index is stored in a single SQLite file
+from array import array
+from collections import namedtuple
+import annotation
+import audio
+import metrics
+import segment_cache
+
+# The default file in which the index is stored
+INDEX_FILE = "cgn_index.sqlite"
+
+# Separators used to pack the words of all the "tau" segments of one annotation in a single string
+WORD_SEPARATOR = "\x1f"
+TAU_SEPARATOR = "\x1e"
+
+# The open connections, per process, thread and index file, so every worker of a pool (and every thread of a pipeline)
+# gets its own connection
+_connections = {}
+
+# The "tau" segments of an annotation as they come from load_annotation: taken from the index, or still to be parsed
+# from the decompressed bytes of the file
+LoadedAnnotation = namedtuple("LoadedAnnotation", ["path", "stat", "taus", "data"])
+
+
+# This function opens (and if needed creates) the index in the given file
+def open_index(index_file=INDEX_FILE):
+    key = (os.getpid(), threading.get_ident(), path.abspath(index_file))
+    if key not in _connections:
+        # Autocommit and WAL, so several processes can read and update the index at the same time
+        connection = sqlite3.connect(index_file, timeout=60, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        # An index from before the XML of the "tau" segments was kept is dropped, the annotations are parsed again
+        columns = [row[1] for row in connection.execute("PRAGMA table_info(annotations)")]
+        if columns and "xml" not in columns:
+            connection.execute("DROP TABLE annotations")
+        connection.execute("CREATE TABLE IF NOT EXISTS annotations ("
+                           "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                           "tb BLOB, te BLOB, words TEXT, speakers TEXT, xml TEXT)")
+        connection.execute("CREATE TABLE IF NOT EXISTS wavs ("
+                           "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                           "frames INTEGER, samplerate INTEGER, channels INTEGER, format_tag INTEGER, "
+                           "bits_per_sample INTEGER)")
+        connection.execute("CREATE TABLE IF NOT EXISTS sources ("
+                           "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha1 TEXT)")
+        _connections[key] = connection
+    return _connections[key]
+
+
+# This function returns all the "tau" segments of an annotation. When an index is given the segments are read from it,
+# unless the size or the modification time of the file changed since it was indexed. Otherwise we parse the file and
+# store the result in the index. The XML of the segments is only kept when asked for, see annotation.iter_taus.
+# The stat result can be passed when the caller already has it, like for probe_wav.
+def read_taus(trans_path, index=None, keep_xml=False, stat=None):
+    if index is None:
+        return annotation.read_taus(trans_path, keep_xml)
+
+    stat = os.stat(trans_path) if stat is None else stat
+    taus = lookup_taus(trans_path, stat, index, keep_xml)
+    if taus is None:
+        taus = annotation.read_taus(trans_path, keep_xml)
+        store_taus(trans_path, stat, taus, index, keep_xml)
+    return taus
+
+
+# This function returns the "tau" segments of an annotation from the index, or None if they are not in it or the file
+# changed since it was indexed. With keep_xml, an annotation that was indexed without its XML is not in it either.
+def lookup_taus(trans_path, stat, index, keep_xml=False):
+    row = index.execute("SELECT size, mtime_ns, tb, te, words, speakers" + (", xml" if keep_xml else "")
+                        + " FROM annotations WHERE path = ?", (path.abspath(trans_path),)).fetchone()
+    fresh = row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns
+    if fresh and (not keep_xml or row[6] is not None):
+        metrics.count("index_annotation_hits")
+        return unpack_taus(*row[2:])
+    metrics.count("index_annotation_misses")
+    return None
+
+
+# Only the annotations that split_cgn.py writes out again are stored with their XML (keep_xml), so the index stays small
+def store_taus(trans_path, stat, taus, index, keep_xml=False):
+    index.execute("INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                  (path.abspath(trans_path), stat.st_size, stat.st_mtime_ns) + pack_taus(taus, keep_xml))
+
+
+# This function does the I/O part of read_taus: it takes the "tau" segments from the index, or otherwise reads and
+# decompresses the annotation without parsing it. It is used by the reader stage of a pipeline, the parsing is done by
+# parse_annotation in the next stage.
+def load_annotation(trans_path, index=None, keep_xml=False, stat=None):
+    stat = os.stat(trans_path) if stat is None and index is not None else stat
+    taus = None if index is None else lookup_taus(trans_path, stat, index, keep_xml)
+    if taus is not None:
+        return LoadedAnnotation(trans_path, stat, taus, None)
+    return LoadedAnnotation(trans_path, stat, None, annotation.read_bytes(trans_path))
+
+
+# This function does the CPU part of read_taus: it parses an annotation that was loaded by load_annotation, and stores
+# the result in the index
+def parse_annotation(loaded, index=None, keep_xml=False):
+    if loaded.taus is not None:
+        return loaded.taus
+    taus = annotation.parse_taus(loaded.data, keep_xml)
+    if index is not None:
+        store_taus(loaded.path, loaded.stat, taus, index, keep_xml)
+    return taus
+
+
+# This function packs the "tau" segments in a compact form: the timestamps as arrays of doubles and the words as one
+# string. The separators can not appear in XML, so the elements are packed the same way (or left out, as NULL).
+def pack_taus(taus, keep_xml=False):
+    tb = array("d", [tau.tb for tau in taus]).tobytes()
+    te = array("d", [tau.te for tau in taus]).tobytes()
+    words = TAU_SEPARATOR.join(WORD_SEPARATOR.join(tau.words) for tau in taus)
+    speakers = TAU_SEPARATOR.join(tau.speaker or "" for tau in taus)
+    xml = TAU_SEPARATOR.join(tau.xml or "" for tau in taus) if keep_xml else None
+    return tb, te, words, speakers, xml
+
+
+# This function does the opposite of pack_taus
+def unpack_taus(tb, te, words, speakers, xml=None):
+    tb = array("d", tb)
+    te = array("d", te)
+    if not tb:
+        return []
+
+    words = [tuple(w.split(WORD_SEPARATOR)) if w else () for w in words.split(TAU_SEPARATOR)]
+    speakers = [s or None for s in speakers.split(TAU_SEPARATOR)]
+    xml = [None] * len(tb) if xml is None else [x or None for x in xml.split(TAU_SEPARATOR)]
+    return [annotation.Tau(*tau) for tau in zip(tb, te, words, speakers, xml)]
+
+
+# This function returns the header information of a WAV file, from the index if the file did not change since it was
+# indexed. The stat result can be passed when the caller already has it (for example from os.scandir).
+def probe_wav(audio_path, stat=None, index=None):
+    if index is None:
+        return audio.probe_wav(audio_path)
+
+    key = path.abspath(audio_path)
+    if stat is None:
+        stat = os.stat(audio_path)
+    row = index.execute("SELECT size, mtime_ns, frames, samplerate, channels, format_tag, bits_per_sample FROM wavs "
+                        "WHERE path = ?", (key,)).fetchone()
+    if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        metrics.count("index_wav_hits")
+        return audio.WavInfo(*row[2:])
+
+    metrics.count("index_wav_misses")
+    info = audio.probe_wav(audio_path)
+    store_wav(audio_path, stat, info, index)
+    return info
+
+
+# This function adds the header information of a WAV file to the index, for example of a segment that was just written
+def store_wav(audio_path, stat, info, index):
+    index.execute("INSERT OR REPLACE INTO wavs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                  (path.abspath(audio_path), stat.st_size, stat.st_mtime_ns) + tuple(info))
+
+
+# This function returns the hash of the content of a recording, which is the source part of the key of its segments in
+# the segment cache. It is taken from the index if the file did not change since it was hashed.
+def source_hash(audio_path, index=None, stat=None):
+    if index is None:
+        return segment_cache.hash_file(audio_path)
+
+    key = path.abspath(audio_path)
+    stat = os.stat(audio_path) if stat is None else stat
+    row = index.execute("SELECT size, mtime_ns, sha1 FROM sources WHERE path = ?", (key,)).fetchone()
+    if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+        metrics.count("index_source_hits")
+        return row[2]
+
+    metrics.count("index_source_misses")
+    sha1 = segment_cache.hash_file(audio_path)
+    index.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (key, stat.st_size, stat.st_mtime_ns, sha1))
+    return sha1
@@ -1,109 +1,217 @@
-import sys
-import os
 from os import path
-import gzip
-import xml.etree.ElementTree as ET
-from pydub import AudioSegment
+import argparse
+import csv
+import numpy as np
+import corpus_index
+import corpus_catalog
+import metrics
+import sharding
 
 DURATION = 4
 
+FILES_PER_SEGMENT = 2  # Every segment is written as a .wav and a .skp file
 
-# The definition that gets called with the target from main
-def count_files(target):
-    # Check to see if we get a correct path
-    if not path.isdir(target):
-        print("Could not locate the target")
-    else:
-        print("Found top level directory in: ", target)
+SWEEP_FILE = "duration_sweep.csv"
 
-    print("Locating the annotations")
+# The file with the counts of a shard, merge_shards.py adds them up to the counts of the whole corpus
+COUNTS_FILE = "file_counts.csv"
 
-    # Go to the transcription directory
-    trans_path = path.join(target, "data/annot/xml/skp-ort")
 
-    # The amount of files that will be created if we use DURATION amount of seconds at least per file
-    num_files = 0
+# The definition that gets called with the arguments from main. A catalog that was already scanned can be given, and
+# the number of files is returned.
+def count_files(args, catalog=None):
+    target = args.target
+    index = None if args.no_index else corpus_index.open_index(args.index)
 
-    # Check every file/directory at the given path
-    for x in os.listdir(trans_path):
-        new_trans_path = path.join(trans_path, x)
-        # If we find a correct directory we need to enter
-        if os.path.isdir(new_trans_path) and x.startswith("comp"):
-            new_trans_path = path.join(trans_path, x)
-            print("---------------------------------------------------------")
-            print("Entering directory " + x)
-            new_files = process_component(new_trans_path)
-            num_files += new_files
-            print(str(new_files) + " in " + new_trans_path)
-            print("---------------------------------------------------------")
-
-    # Do times two because we do the same splits for every audio file
-    num_files = num_files * 2
-    print("The number of files created with at least " + str(DURATION) + " seconds is: " + str(num_files))
-
-
-# This definition will process one component at a time at the given paths.
-def process_component(trans_path):
-    # Loop over every directory (= language)
-    files = 0
-    for directory in os.listdir(trans_path):
-        print("Processing files for language: " + directory)
-        trans_dir = path.join(trans_path, directory)
-        for file in os.listdir(trans_dir):
-            if file.startswith("fn") or file.startswith("fv"):
-                files += count_file(trans_dir, file)
-        print("Finished processing language: " + directory)
-
-    return files
-
-
-def count_file(trans_dir, filename):
-    # The current filename ends with .wav but we need it to be .skp
-    name = filename.split(".")[0]
-    filename = name + ".skp"
-    trans_path = path.join(trans_dir, filename)
-
-    # If the file does not exist, it means that it has not been extracted
-    if not path.exists(trans_path):
-        zipped_file = filename + ".gz"
-        trans_path = path.join(trans_dir, zipped_file)
-        # We open the zipped file and parse the tree from it
-        with gzip.open(trans_path) as trans_file:
-            tree = ET.parse(trans_file)
-
-    # Otherwise the file is extracted and we can just parse instantly
+    # Check to see if we get a correct path
+    if not path.isdir(target):
+        metrics.log("Could not locate the target")
     else:
-        trans_path = path.join(trans_dir, filename)
-        trans_file = open(trans_path, "r")
-        tree = ET.parse(trans_file)
+        metrics.log("Found top level directory in: " + target)
 
-    root = tree.getroot()
+    metrics.log("Locating the annotations")
 
-    begin = 0
-    end = 0
-    files = 0
+    # Find all the recordings and their annotations at once, only the ones with both can be split
+    if catalog is None:
+        catalog = corpus_catalog.get_catalog(target, args.catalog)
+    catalog = sharding.select(catalog, args.shard)
+    catalog.report()
+    recordings = catalog.originals()
 
-    # This for loop will iterate over all the "tau" segments (more or less equal to a sentence each)
-    for tau in root.iter("tau"):
-        seg_begin = float(tau.get("tb"))  # The begin of the segment
-        seg_end = float(tau.get("te"))
-
-        # If we start at a new segment we have to reset the beginning
-        if end == 0:
-            begin = seg_begin
-
-        end = seg_end
-        duration = end - begin
-        if duration >= DURATION:
-            end = 0
-            files += 1
-
-    return files
+    # The amount of files that will be created if we use DURATION amount of seconds at least per file
+    num_files = 0
+    num_seconds = 0
+
+    # The timestamps of all the recordings, we only keep them when we have to do a sweep
+    all_boundaries = []
+
+    # Check every component
+    for x in sorted(set(comp for comp, _ in catalog.partitions())):
+        metrics.log("---------------------------------------------------------")
+        metrics.log("Entering directory " + x)
+        boundaries = process_component([r for r in recordings if r.component == x], index)
+        segments, seconds = count_segments(boundaries, [args.duration])
+        new_files = int(segments[0]) * FILES_PER_SEGMENT
+        num_files += new_files
+        num_seconds += float(seconds[0])
+        metrics.log(str(new_files) + " in " + path.join(target, corpus_catalog.TRANS_DIR, x))
+        metrics.log("---------------------------------------------------------")
+        if args.sweep:
+            all_boundaries += boundaries
+
+    print_result(args.duration, num_files)
+
+    thresholds = None
+    if args.sweep:
+        start, stop, step = args.sweep
+        thresholds = np.arange(start, stop + step / 2, step)
+
+    # A shard only writes its counts, the sweep is written once all the shards are merged
+    if args.shard is not None:
+        rows = [("duration", args.duration, num_files // FILES_PER_SEGMENT, num_seconds)]
+        if thresholds is not None:
+            segments, seconds = count_segments(all_boundaries, thresholds)
+            rows += [("sweep", float(d), int(n), float(s)) for d, n, s in zip(thresholds, segments, seconds)]
+        counts_file = sharding.shard_file(COUNTS_FILE, args.shard)
+        write_counts(counts_file, rows)
+        sharding.write_checksum(counts_file)
+        metrics.log("Written the counts of the shard to " + counts_file)
+    elif thresholds is not None:
+        sweep(all_boundaries, thresholds, args.sweep_output)
+
+    return num_files
+
+
+def print_result(duration, num_files):
+    print("The number of files created with at least " + str(duration) + " seconds is: " + str(num_files))
+
+
+# This definition will process the recordings of one component at a time.
+# It returns the timestamps of the "tau" segments of every recording in the component.
+def process_component(recordings, index=None):
+    # Loop over every language
+    boundaries = []
+    for language in sorted(set(r.language for r in recordings)):
+        metrics.log("Processing files for language: " + language)
+        for recording in recordings:
+            if recording.language == language:
+                boundaries.append(read_boundaries(recording.trans_path, index, recording.trans_stat))
+                metrics.count("annotations")
+        metrics.log("Finished processing language: " + language)
+
+    return boundaries
+
+
+# This definition reads the begin and end timestamps of all the "tau" segments of one recording
+def read_boundaries(trans_path, index=None, stat=None):
+    taus = corpus_index.read_taus(trans_path, index, stat=stat)
+    tb = np.array([tau.tb for tau in taus], dtype=np.float64)
+    te = np.array([tau.te for tau in taus], dtype=np.float64)
+    return tb, te
+
+
+# This definition counts the segments split_cgn.py creates for every threshold at once, together with their total
+# duration in seconds. Like in split_cgn.py, "tau" segments are grouped until the group lasts at least the threshold.
+# The recordings are sorted from long to short, so at the k-th "tau" segment only the first n recordings still take
+# part and we can update the state of every threshold and every recording with one slice.
+def count_segments(boundaries, thresholds):
+    thresholds = np.asarray(thresholds, dtype=np.float64)[:, None]
+    segments = np.zeros(len(thresholds), dtype=np.int64)
+    seconds = np.zeros(len(thresholds), dtype=np.float64)
+    if not boundaries:
+        return segments, seconds
+
+    lengths = np.array([len(tb) for tb, _ in boundaries])
+    order = np.argsort(-lengths, kind="stable")
+    lengths = lengths[order]
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    tb = np.concatenate([boundaries[i][0] for i in order])
+    te = np.concatenate([boundaries[i][1] for i in order])
+
+    # The state of the grouping for every threshold (rows) and recording (columns). An end of 0 means a new group starts.
+    begin = np.zeros((len(thresholds), len(lengths)))
+    end = np.zeros((len(thresholds), len(lengths)))
+    counts = np.zeros((len(thresholds), len(lengths)), dtype=np.int64)
+    retained = np.zeros((len(thresholds), len(lengths)))
+
+    for k in range(int(lengths[0]) if len(lengths) else 0):
+        n = np.searchsorted(-lengths, -k, side="left")  # The number of recordings with more than k segments
+        seg_begin = tb[offsets[:n] + k]
+        seg_end = te[offsets[:n] + k]
+
+        state_begin = begin[:, :n]
+        state_end = end[:, :n]
+        np.copyto(state_begin, np.broadcast_to(seg_begin, state_begin.shape), where=state_end == 0)
+        state_end[:] = seg_end
+
+        duration = state_end - state_begin
+        done = duration >= thresholds
+        counts[:, :n] += done
+        retained[:, :n] += np.where(done, duration, 0)
+        state_end[done] = 0
+
+    return counts.sum(axis=1), retained.sum(axis=1)
+
+
+# This definition calculates the number of files and hours of audio for a whole range of thresholds in one pass
+def sweep(boundaries, thresholds, output_file):
+    segments, seconds = count_segments(boundaries, thresholds)
+    write_sweep(thresholds, segments, seconds, output_file)
+
+
+# This definition prints the counts of a sweep and writes them to a CSV file
+def write_sweep(thresholds, segments, seconds, output_file):
+    metrics.log("---------------------------------------------------------")
+    print("duration  segments  files  hours")
+    with open(output_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["duration", "segments", "files", "hours"])
+        for duration, num_segments, num_seconds in zip(thresholds, segments, seconds):
+            row = [round(float(duration), 6), int(num_segments), int(num_segments) * FILES_PER_SEGMENT,
+                   round(num_seconds / 3600, 3)]
+            writer.writerow(row)
+            print("%8g  %8d  %5d  %5.3f" % tuple(row))
+    metrics.log("Written the sweep to " + output_file)
+
+
+# This definition writes the counts of a shard (or of the merged shards), with the seconds in full precision so the sums
+# of the shards are exact
+def write_counts(counts_file, rows):
+    with open(counts_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["kind", "duration", "segments", "seconds"])
+        for kind, duration, num_segments, num_seconds in rows:
+            writer.writerow([kind, repr(float(duration)), num_segments, repr(num_seconds)])
+
+
+# This function builds the parser for the command line arguments, preprocess.py uses it for the defaults as well
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="the top level target directory")
+    parser.add_argument("--duration", type=float, default=DURATION, help="the minimum duration of a file in seconds")
+    parser.add_argument("--sweep", type=float, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="also count the files for every duration from START to STOP (inclusive) in one pass")
+    parser.add_argument("--sweep-output", default=SWEEP_FILE, help="the CSV file the sweep is written to")
+    parser.add_argument("--index", default=corpus_index.INDEX_FILE, help="the file with the cached annotation index")
+    parser.add_argument("--no-index", action="store_true", help="always parse the annotations, without using the index")
+    parser.add_argument("--catalog", help="use the catalog saved in this file instead of scanning the target")
+    parser.add_argument("--shard", type=sharding.parse_shard, metavar="i/N",
+                        help="only count the i-th of N shards of the recordings and write its counts to "
+                             + sharding.shard_file(COUNTS_FILE, ("i", "N")) + ", see merge_shards.py")
+    parser.add_argument("--quiet", action="store_true", help="only print the results")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every file")
+    parser.add_argument("--metrics", help="write the counters and timers to this JSON file")
+    return parser
 
 
 if __name__ == "__main__":
-    print("Starting the counting of the data")
+    # Starting the parser for the command line arguments
+    args = get_parser().parse_args()
+
+    metrics.configure(args.quiet, args.verbose)
+    metrics.log("Starting the counting of the data")
 
-    count_files(sys.argv[1])
+    count_files(args)
 
-    print("Completed successfully")
\ No newline at end of file
+    metrics.summarize(args.metrics)
+    metrics.log("Completed successfully")
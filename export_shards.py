@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+import os
+from os import path
+import argparse         # This module is used to pass optional flags to the exporter
+import pandas as pd     # Pandas is used to read the CSV files of the splits
+import audio
+import import_cgn       # This is used for the names of the CSV files of the splits
+import shards           # This is used to write the shards and their index
+import metrics
+
+# The number of rows that are read from a CSV file at once
+CHUNK_SIZE = 10000
+
+
+# This function packs the files of every given split into shards in the target directory
+def export(args):
+    os.makedirs(args.target, exist_ok=True)
+    for csv_file in args.csv:
+        if not path.exists(csv_file):
+            metrics.log("Could not find " + csv_file)
+            continue
+        prefix = path.splitext(path.basename(csv_file))[0]
+        writer = shards.ShardWriter(args.target, prefix, args.shard_size * 1024 * 1024)
+        export_split(csv_file, writer, audio.AudioFormat(args.samplerate, args.channels, args.sample_width))
+        writer.close()
+        metrics.count("samples", writer.samples)
+        metrics.log("Written " + str(writer.samples) + " samples of " + csv_file + " to " + str(writer.shards)
+                    + " shards, see " + writer.index_path)
+
+
+# This function adds every row of a CSV file written by import_cgn.py to the shards. When the rows come from a manifest
+# (they have a first frame and a number of frames) the samples are read from the original recordings, with one opened
+# file for all the segments of a recording. Otherwise the files split_cgn.py cut are copied as they are, unless they do
+# not have the target format.
+def export_split(csv_file, writer, target=None):
+    audio_file = None
+    try:
+        for chunk in pd.read_csv(csv_file, chunksize=CHUNK_SIZE, keep_default_na=False):
+            virtual = "start_frame" in chunk.columns
+            for row in chunk.itertuples(index=False):
+                if virtual:
+                    if audio_file is None or audio_file.name != row.wav_filename:
+                        if audio_file is not None:
+                            audio_file.close()
+                        audio_file = audio.open_audio(row.wav_filename)
+                    wav_bytes = audio.encode_wav(*audio.read_converted(audio_file, int(row.start_frame),
+                                                                       int(row.num_frames), target))
+                elif any(target):
+                    with audio.open_audio(row.wav_filename) as f:
+                        wav_bytes = audio.encode_wav(*audio.read_converted(f, 0, f.frames, target))
+                else:
+                    with open(row.wav_filename, "rb") as f:
+                        wav_bytes = f.read()
+                writer.add(wav_bytes, str(row.transcript))
+                metrics.detail("Packed " + row.wav_filename)
+    finally:
+        if audio_file is not None:
+            audio_file.close()
+
+
+if __name__ == "__main__":
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="the directory the shards and their indexes are written to")
+    parser.add_argument("--csv", nargs='+',
+                        default=[import_cgn.FILENAME_TRAIN, import_cgn.FILENAME_DEV, import_cgn.FILENAME_TEST],
+                        help="the CSV files written by import_cgn.py, every file gets its own shards")
+    parser.add_argument("--shard-size", type=int, default=shards.SHARD_SIZE // (1024 * 1024),
+                        help="the size of a shard in MB")
+    parser.add_argument("--samplerate", type=int, help="resample the samples to this sample rate")
+    parser.add_argument("--channels", type=int, help="mix the samples down (or up) to this number of channels")
+    parser.add_argument("--sample-width", type=int, choices=sorted(audio.SUBTYPES),
+                        help="store the samples with this many bytes per sample")
+    parser.add_argument("--quiet", action="store_true", help="only print the results")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every file")
+    parser.add_argument("--metrics", help="write the counters and timers to this JSON file")
+    args = parser.parse_args()
+
+    metrics.configure(args.quiet, args.verbose)
+    metrics.log("Starting the export of the shards")
+    export(args)
+    metrics.summarize(args.metrics)
+    metrics.log("Completed successfully")
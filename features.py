@@ -0,0 +1,133 @@
+import os
+from os import path
+import numpy as np
+
+# The default parameters of the features: 25 ms windows every 10 ms, like most speech recognition models use
+WINDOW = 0.025
+HOP = 0.010
+N_MELS = 40
+N_MFCC = 26
+PREEMPHASIS = 0.97
+
+# The features are stored as float32, every row is one frame
+DTYPE = np.float32
+
+# The filterbanks, per sample rate and number of mel bands, so they are only built once per process
+_filterbanks = {}
+
+
+# This function returns the name of the index of a feature file
+def index_name(data_file):
+    return data_file + ".index.npz"
+
+
+def hz_to_mel(hz):
+    return 2595 * np.log10(1 + hz / 700)
+
+
+def mel_to_hz(mel):
+    return 700 * (10 ** (mel / 2595) - 1)
+
+
+# This function returns the number of FFT points for a window: the first power of two that fits the window
+def fft_size(window_length):
+    return 1 << (window_length - 1).bit_length()
+
+
+# This function builds (once) a matrix of triangular filters with shape (n_mels, n_fft // 2 + 1)
+def mel_filterbank(samplerate, n_fft, n_mels):
+    key = (samplerate, n_fft, n_mels)
+    if key not in _filterbanks:
+        mels = np.linspace(hz_to_mel(0), hz_to_mel(samplerate / 2), n_mels + 2)
+        bins = np.fft.rfftfreq(n_fft, 1 / samplerate)
+        edges = mel_to_hz(mels)
+        lower = (bins[None, :] - edges[:-2, None]) / (edges[1:-1, None] - edges[:-2, None])
+        upper = (edges[2:, None] - bins[None, :]) / (edges[2:, None] - edges[1:-1, None])
+        _filterbanks[key] = np.maximum(0, np.minimum(lower, upper)).astype(DTYPE)
+    return _filterbanks[key]
+
+
+# This function returns the orthonormal DCT-II matrix with shape (n_mfcc, n_mels)
+def dct_matrix(n_mfcc, n_mels):
+    k = np.arange(n_mfcc)[:, None]
+    n = np.arange(n_mels)[None, :]
+    dct = np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2 / n_mels)
+    dct[0] /= np.sqrt(2)
+    return dct.astype(DTYPE)
+
+
+# This function cuts a (mono) signal into overlapping frames without copying it. Signals shorter than one window are
+# padded so every segment has at least one frame.
+def frame_signal(signal, window_length, hop_length):
+    if len(signal) < window_length:
+        signal = np.pad(signal, (0, window_length - len(signal)))
+    return np.lib.stride_tricks.sliding_window_view(signal, window_length)[::hop_length]
+
+
+# This function computes the features of a batch of signals with the same sample rate. The frames of all the signals
+# are stacked, so the FFT and the filterbank are done in one go for the whole batch. Returns one array per signal with
+# a row for every frame.
+def compute_batch(signals, samplerate, kind="logmel", n_mels=N_MELS, n_mfcc=N_MFCC, window=WINDOW, hop=HOP):
+    window_length = int(round(window * samplerate))
+    hop_length = int(round(hop * samplerate))
+    n_fft = fft_size(window_length)
+
+    frames = []
+    for signal in signals:
+        signal = np.append(signal[:1], signal[1:] - PREEMPHASIS * signal[:-1]).astype(DTYPE)
+        frames.append(frame_signal(signal, window_length, hop_length))
+    lengths = [len(f) for f in frames]
+    frames = np.concatenate(frames) * np.hamming(window_length).astype(DTYPE)
+
+    power = np.abs(np.fft.rfft(frames, n_fft)) ** 2 / n_fft
+    features = np.log(power.astype(DTYPE) @ mel_filterbank(samplerate, n_fft, n_mels).T + 1e-10)
+    if kind == "mfcc":
+        features = features @ dct_matrix(n_mfcc, n_mels).T
+
+    return np.split(features.astype(DTYPE), np.cumsum(lengths)[:-1])
+
+
+# This class appends the features of segments to one data file and writes the offsets (in frames) of every segment to
+# an index next to it. The data file holds the rows of all the segments after each other, so it can be memory-mapped.
+class FeatureWriter:
+    def __init__(self, data_file, num_features):
+        self.data_file = data_file
+        self.num_features = num_features
+        self.offsets = [0]
+        self.file = open(data_file + ".part", "wb")
+
+    def add(self, features):
+        self.file.write(np.ascontiguousarray(features, dtype=DTYPE).tobytes())
+        self.offsets.append(self.offsets[-1] + len(features))
+
+    # The data file and the index are written to temporary files first and renamed, the index last
+    def close(self):
+        self.file.close()
+        os.replace(self.data_file + ".part", self.data_file)
+        with open(index_name(self.data_file) + ".part", "wb") as f:
+            np.savez(f, offsets=np.array(self.offsets, dtype=np.int64), num_features=self.num_features)
+        os.replace(index_name(self.data_file) + ".part", index_name(self.data_file))
+
+
+# This class gives the features of every segment as a view on the memory-mapped data file, nothing is copied or read
+# before it is used.
+class FeatureReader:
+    def __init__(self, data_file):
+        with np.load(index_name(data_file)) as index:
+            self.offsets = index["offsets"]
+            num_features = int(index["num_features"])
+        if self.offsets[-1] == 0:
+            self.data = np.zeros((0, num_features), dtype=DTYPE)
+        else:
+            self.data = np.memmap(data_file, dtype=DTYPE, mode="r", shape=(int(self.offsets[-1]), num_features))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]]
+
+
+# This function returns the feature file that belongs to a CSV file, it is stored next to it
+def feature_file(csv_file, kind):
+    return path.splitext(csv_file)[0] + "." + kind + ".f32"
@@ -0,0 +1,109 @@
+import os
+from os import path
+import argparse
+import gzip
+import random
+from xml.sax.saxutils import quoteattr
+import numpy as np
+import soundfile as sf
+
+# The words the transcriptions are made of
+VOCABULARY = ["de", "het", "een", "en", "ik", "je", "dat", "is", "niet", "wat", "ja", "nee", "goed", "huis", "auto",
+              "fiets", "straat", "één", "café", "ideeën", "zo'n", "'s", "weet-je", "uh"]
+
+# Words that are rejected by the importer, so every rule gets exercised. A word is one of these with FORBIDDEN_RATE.
+FORBIDDEN = ["ggg", "xxx", "a&b", "2"]
+FORBIDDEN_RATE = 0.01
+
+LANGUAGES = ["nl", "vl"]
+
+BLOCK_SECONDS = 10  # The audio is generated and written in blocks of this many seconds
+
+
+# This function generates a fake CGN tree at the given target, with the same layout as the real corpus
+def generate(args):
+    rng = random.Random(args.seed)
+    audio_path = path.join(args.target, "data/audio/wav")
+    trans_path = path.join(args.target, "data/annot/xml/skp-ort")
+
+    number = 0
+    total_seconds = 0
+    for comp in args.components:
+        for language in LANGUAGES:
+            audio_dir = path.join(audio_path, "comp-" + comp, language)
+            trans_dir = path.join(trans_path, "comp-" + comp, language)
+            os.makedirs(audio_dir, exist_ok=True)
+            os.makedirs(trans_dir, exist_ok=True)
+
+            for _ in range(args.recordings):
+                name = "f" + language[0] + str(number).zfill(6)
+                number += 1
+                seconds = args.duration * rng.uniform(0.5, 1.5)
+                write_audio(path.join(audio_dir, name + ".wav"), seconds, args.samplerate, rng)
+                write_annotation(trans_dir, name, seconds, rng.random() < args.gzip, rng)
+                total_seconds += seconds
+
+            print("Generated " + str(args.recordings) + " recordings in " + audio_dir)
+
+    print("Generated " + str(number) + " recordings with %.2f hours of audio" % (total_seconds / 3600))
+
+
+# This function writes a recording of noise, block by block so memory does not depend on its length
+def write_audio(audio_path, seconds, samplerate, rng):
+    np_rng = np.random.default_rng(rng.getrandbits(32))
+    frames = int(seconds * samplerate)
+    with sf.SoundFile(audio_path, "w", samplerate, 1, "PCM_16", format="WAV") as f:
+        for start in range(0, frames, BLOCK_SECONDS * samplerate):
+            block = min(BLOCK_SECONDS * samplerate, frames - start)
+            f.write((np_rng.standard_normal(block) * 1000).astype(np.int16))
+
+
+# This function writes the annotation of a recording, with "tau" segments (sentences) of "tw" elements (words).
+# Once in a while a segment overlaps with the previous one, like in the real corpus.
+def write_annotation(trans_dir, name, seconds, zipped, rng):
+    parts = ['<?xml version="1.0" encoding="ISO-8859-1"?>\n<ttext>']
+    begin = rng.uniform(0, 1)
+    i = 0
+    while True:
+        end = begin + rng.uniform(0.5, 4)
+        if end > seconds:
+            break
+        speaker = "N0" + str(rng.randint(1000, 1003))
+        parts.append('<tau ref="%s.%d" s="%s" tb="%.3f" te="%.3f">' % (name, i, speaker, begin, end))
+        words = [rng.choice(FORBIDDEN) if rng.random() < FORBIDDEN_RATE else rng.choice(VOCABULARY)
+                 for _ in range(rng.randint(1, 8))]
+        step = (end - begin) / len(words)
+        for j, word in enumerate(words):
+            parts.append('<tw ref="%s.%d.%d" tb="%.3f" te="%.3f" w=%s/>'
+                         % (name, i, j, begin + j * step, begin + (j + 1) * step, quoteattr(word)))
+        parts.append("</tau>\n")
+        begin = end + (rng.uniform(-0.3, 0) if rng.random() < 0.02 else rng.uniform(0.05, 0.5))
+        i += 1
+    parts.append("</ttext>\n")
+
+    data = "".join(parts).encode("ISO-8859-1")
+    if zipped:
+        with gzip.open(path.join(trans_dir, name + ".skp.gz"), "wb") as f:
+            f.write(data)
+    else:
+        with open(path.join(trans_dir, name + ".skp"), "wb") as f:
+            f.write(data)
+
+
+if __name__ == "__main__":
+    print("Starting the generation of the corpus")
+
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="the top level directory of the generated corpus")
+    parser.add_argument("--components", nargs='+', default=["a", "b"], help="the names of the components")
+    parser.add_argument("--recordings", type=int, default=10, help="the number of recordings per component and language")
+    parser.add_argument("--duration", type=float, default=300, help="the average length of a recording in seconds")
+    parser.add_argument("--samplerate", type=int, default=16000, help="the sample rate of the recordings")
+    parser.add_argument("--gzip", type=float, default=0.5, help="the fraction of the annotations that is zipped")
+    parser.add_argument("--seed", type=int, default=0, help="the seed, the same seed always gives the same corpus")
+    args = parser.parse_args()
+
+    generate(args)
+
+    print("Completed successfully")
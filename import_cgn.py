@@ -3,10 +3,21 @@
 import os
 from os import path
 import argparse         # This module is used to pass optional flags to the importer
-import soundfile as sf  # This module is used to calculate the length of the sound files
+import hashlib          # This is used to divide the recordings over the splits
+from collections import Counter
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd     # Pandas is used to construct the CSV file
-import xml.etree.ElementTree as ET      # This is used to parse the XML file with the transcriptions
-import gzip          # This is used to extract the transcriptions if they are still zipped
+import annotation       # This is used to read the XML files with the transcriptions
+import corpus_index     # This is used to calculate the length of the sound files and cache it with the transcriptions
+import corpus_catalog   # This is used to find the sound files and their annotations
+import manifest         # This is used to read the segments when split_cgn.py did not cut the recordings
+import normalize        # This is used to build the transcriptions and reject the ones we do not want
+import audio
+import metrics          # This is used to count the rejections and time the hot paths
+import stages           # This is used to read and parse the files in overlapping stages
+import sharding         # This is used to only import the recordings of one shard
+import buckets          # This is used to order the splits by the length of the files
 
 # Global variable specifying the maximum and minimum accepted lengths of a speech file
 MAX_SECS = 10
@@ -20,299 +31,528 @@ FILENAME_TEST = "test_data_strip.csv"
 # The percentage by which we split the training and testing sets
 TRAIN_SPLIT = 0.8
 
-# Forbidden characters that we do not want to have in our transcription
-CHARACTERS = ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]
-WORDS = ["ggg", "Xxx", "xxx"]
+# The columns of the splits. The lengths let a loader sort or bucket the files without reading any audio: the duration
+# in seconds, the number of samples (per channel) and the number of characters of the transcript.
+LENGTH_COLUMNS = ['duration', 'num_samples', 'transcript_length']
+COLUMNS = ['wav_filename', 'wav_filesize', 'transcript'] + LENGTH_COLUMNS
 
+# When we import the segments of a manifest, the rows also need to say which part of the recording they are about
+MANIFEST_COLUMNS = COLUMNS + ['start_frame', 'num_frames']
 
-# This function will preprocess the data given a target (the top level directory of CGN)
-def preprocess_data(args):
+# What the files are divided over the splits by: every file of the same recording (or the same speaker) ends up in the
+# same split
+GROUP_BY = ["recording", "speaker"]
+
+# The number of rows we keep in memory for a split before they are written to its file
+CHUNK_SIZE = 10000
+
+
+# This function will preprocess the data given a target (the top level directory of CGN). A catalog that was already
+# scanned can be given, and the number of rows in every split is returned.
+def preprocess_data(args, catalog=None):
 
     target = args.target
+    index_file = None if args.no_index else args.index
+
+    # The transcriptions are normalized while they are parsed, unless the user wants to run clean_data.py afterwards
+    rules = normalize.importer_rules() if args.no_clean else normalize.compile_rules()
 
     # Check to see if we get a correct path
     if not path.isdir(target):
-        print("Could not locate the target")
+        metrics.log("Could not locate the target")
     else:
-        print("Found top level directory in: ", target)
-
-    print("Locating the sound files and corresponding annotations")
+        metrics.log("Found top level directory in: " + target)
 
-    # Go to the audio and transcription directories
-    audio_path = path.join(target, "data/audio/wav")
-    trans_path = path.join(target, "data/annot/xml/skp-ort")
+    metrics.log("Locating the sound files and corresponding annotations")
 
-    # The dataframe holding all the data
-    data = pd.DataFrame()
+    # The accepted files are written to the splits as we go, every shard has its own files
+    filenames = split_filenames(args.shard)
 
-    # Check if the user chose a specific component
-    if args.components:
-        print("Components: " + str(args.components))
-        for comp in args.components:
-            new_audio_path = path.join(audio_path, "comp-" + comp)
-            new_trans_path = path.join(trans_path, "comp-" + comp)
-            if not path.isdir(audio_path):
-                print("The given component: " + comp + " could not be found")
-            else:
-                print("---------------------------------------------------------")
-                print("Entering directory " + comp)
-                new_data = process_component(new_audio_path, new_trans_path)
-                data = data.append(new_data)
-                print("---------------------------------------------------------")
+    # Check if we have to import the segments of a manifest instead of the files that split_cgn.py cut
+    if args.manifest:
+        metrics.log("Importing the segments in " + args.manifest)
+        writer = SplitWriter(filenames, MANIFEST_COLUMNS, group_by=args.group_by)
+        index = None if index_file is None else corpus_index.open_index(index_file)
+        target_format = audio.AudioFormat(args.samplerate, args.channels, args.sample_width)
+        process_manifest(args.manifest, writer, rules, index, target_format, args.shard)
     else:
-        print("Utilizing all available components")
-        # Check everything at the given path. The subdirectories are the same for audio and trans
-        for x in os.listdir(audio_path):
-            new_audio_path = path.join(audio_path, x)
-            # If we find a correct directory we need to enter
-            if os.path.isdir(new_audio_path) and x.startswith("comp"):
-                new_trans_path = path.join(trans_path, x)
-                print("---------------------------------------------------------")
-                print("Entering directory " + x)
-                new_data = process_component(new_audio_path, new_trans_path)
-                data = data.append(new_data)
-                print("---------------------------------------------------------")
-
-    # Generate the final splits
-    generate_splits(data)
-
-
-# This function takes care of one component of the data
-def process_component(audio_path, trans_path):
-    lang = args.language
-
-    data = pd.DataFrame()
-    # If flemish is selected we will enter this
-    # If no language was chose we want both so we also enter this
-    if not lang or lang == "vl":
-        print("Processing the Flemish language files")
-        new_audio_path = path.join(audio_path, "vl")
-        new_trans_path = path.join(trans_path, "vl")
-        # This check is just to make sure the directory exists
-        if os.path.isdir(new_audio_path):
-            new_data = process_language(new_audio_path, new_trans_path)
-            data = data.append(new_data)
+        writer = SplitWriter(filenames, group_by=args.group_by)
+
+        # Find all the segments and their annotations at once
+        if catalog is None:
+            catalog = corpus_catalog.get_catalog(target, args.catalog)
+        catalog = sharding.select(catalog, args.shard)
+        catalog.report()
+        found = set(comp for comp, _ in catalog.partitions())
+
+        # Check if the user chose a specific component
+        if args.components:
+            metrics.log("Components: " + str(args.components))
+            components = ["comp-" + comp for comp in args.components]
         else:
-            print("Directory does not exist")
-
-    # Same here for the dutch language
-    if not lang or lang == "nl":
-        print("Processing the Dutch language files")
-        new_audio_path = path.join(audio_path, "nl")
-        new_trans_path = path.join(trans_path, "nl")
-        if os.path.isdir(new_audio_path):
-            new_data = process_language(new_audio_path, new_trans_path)
-            data = data.append(new_data)
+            metrics.log("Utilizing all available components")
+            # The components are sorted so the order of the rows is always the same.
+            components = sorted(found)
+
+        # Collect every component and language that has to be processed
+        partitions = []
+        for comp in components:
+            if comp not in found:
+                metrics.log("The given component: " + comp + " could not be found")
+            else:
+                metrics.log("Entering directory " + comp)
+                partitions += process_component(catalog, comp, args.language)
+
+        metrics.log("---------------------------------------------------------")
+        run_partitions(partitions, writer, rules, args.workers, index_file, args.pipeline)
+        metrics.log("---------------------------------------------------------")
+
+    # Write what is left in the buffers of the splits
+    writer.close()
+    for split, filename in writer.filenames.items():
+        metrics.log("Written " + str(writer.counts[split]) + " files to the " + split + " split in " + filename)
+        # The checksums let merge_shards.py check that the files of a shard are complete
+        if args.shard is not None:
+            sharding.write_checksum(filename)
+
+    # The splits can also be written ordered by the length of the files, from the lengths in the rows only. A shard is
+    # only a part of the splits, so its files are ordered once they are merged.
+    if args.length_order:
+        if args.shard is not None:
+            metrics.log("Run buckets.py on the merged splits to order them by length")
         else:
-            print("Directory does not exist")
+            metrics.log("---------------------------------------------------------")
+            buckets.order_splits(list(writer.filenames.values()), args.length_order, args.bucket_width)
+
+    return writer.counts
+
+
+# This function returns the CSV files of the splits, of the given shard
+def split_filenames(shard=None):
+    return {"train": sharding.shard_file(FILENAME_TRAIN, shard),
+            "dev": sharding.shard_file(FILENAME_DEV, shard),
+            "test": sharding.shard_file(FILENAME_TEST, shard)}
+
+
+# This function takes care of one component of the data. It returns the languages that have to be processed, every
+# language with the segments in it that have an annotation.
+def process_component(catalog, comp, lang=None):
+    partitions = []
+    segments = catalog.segments()
+
+    # If flemish is selected we will enter this
+    # If no language was chose we want both so we also enter this
+    for language in ["vl", "nl"]:
+        if not lang or lang == language:
+            # This check is just to make sure the directory exists
+            if (comp, language) in catalog.partitions():
+                recordings = [r for r in segments if r.component == comp and r.language == language]
+                partitions.append((catalog.audio_dir(comp, language), recordings))
+            else:
+                metrics.log("Directory does not exist: " + catalog.audio_dir(comp, language))
 
     if lang and lang != "nl" and lang != "vl":
-        print("The provided language was invalid")
+        metrics.log("The provided language was invalid")
+
+    return partitions
+
+
+# This function processes all the given languages of all components, either one at a time or in a pool of processes.
+# The results are added to the splits in the order of the partitions, so the same data always gives the same CSV files.
+# With a pipeline (the number of threads per stage) the files of every language are read and parsed in overlapping
+# stages.
+def run_partitions(partitions, writer, rules, workers, index_file=None, pipeline=0):
+    tasks = [(recordings, rules, index_file, pipeline) for _, recordings in partitions]
+    if workers > 1:
+        metrics.log("Processing " + str(len(tasks)) + " languages using " + str(workers) + " workers")
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=metrics.configure,
+                                       initargs=(metrics.settings["quiet"], metrics.settings["verbose"]))
+        results = executor.map(language_task, tasks)
+    else:
+        executor = None
+        results = map(language_task, tasks)
+
+    total_rejected = Counter()
+    for (audio_path, _), ((rows, rejected), task_metrics) in zip(partitions, results):
+        metrics.merge(task_metrics)
+        for speaker, row in rows:
+            writer.add(speaker, *row)
+        metrics.log(audio_path + ": accepted " + str(len(rows)) + ", rejected " + str(sum(rejected.values())))
+        total_rejected += rejected
+
+    if executor is not None:
+        executor.shutdown()
+
+    print_rejections(total_rejected)
+
+
+# This function prints the number of rejected files for every reason and adds them to the metrics
+def print_rejections(rejected):
+    for reason, count in sorted(rejected.items()):
+        metrics.log("Rejected because of " + reason + ": " + str(count))
+        metrics.count("rejected_" + reason, count)
+
 
-    return data
+# This function processes one language of one component.
+# It returns the result of process_language together with the metrics of this language.
+def language_task(task):
+    return metrics.collect(process_language, *task)
 
 
-# This function processes one language each time it gets called
-def process_language(audio_path, trans_path):
-    files = sorted(os.listdir(audio_path))  # Needs to be sorted so that we can use the "previous" later.
+# This function processes one language each time it gets called. Every process (and every thread of a pipeline) opens
+# its own connection to the index.
+# It returns the accepted rows (with the speaker of every row) and the number of rejected files for every reason.
+# The segments come from the catalog: the original file may still be there but we only want to account for files that
+# are split, and the sizes are the ones of the scan of the catalog.
+def process_language(files, rules, index_file=None, pipeline=0):
+    # Needs to be sorted so that we can use the "previous" later.
+    files = sorted(files, key=lambda recording: recording.name)
+
+    # The headers and the transcriptions of the files, in the order of the files
+    if pipeline:
+        checked = stages.run_stages(files, [(partial(read_file, index_file), pipeline),
+                                            (partial(inspect_file, rules, index_file), pipeline)])
+    else:
+        index = None if index_file is None else corpus_index.open_index(index_file)
+        checked = (check_file(recording, rules, index) for recording in files)
     accepted = 0
-    accepted_wavs = []
-    accepted_wav_sizes = []
-    accepted_wav_transcripts = []
-    rejected = 0
+    rejected = Counter()
+    rows = []
 
     previous_end = 0
     possible_file = None
     possible_filesize = 0
+    possible_info = None
     possible_transcript = ""
+    possible_reason = None
+    possible_speaker = None
 
-    def maybe_add(possible_file, possible_filesize, possible_transcript):
-        if possible_transcript and possible_transcript != "":
-            print("File: " + possible_file + " and Transcript: " + str(possible_transcript))
+    def maybe_add(possible_file, possible_filesize, possible_info, possible_transcript, possible_reason,
+                  possible_speaker):
+        if possible_transcript:
+            metrics.detail("File: " + possible_file + " and Transcript: " + str(possible_transcript))
             # Import the previous file.
             nonlocal accepted
             accepted += 1
-            accepted_wavs.append(possible_file)
-            accepted_wav_sizes.append(possible_filesize)
-            accepted_wav_transcripts.append(possible_transcript)
+            metrics.count("accepted")
+            rows.append((possible_speaker, (possible_file, possible_filesize, possible_transcript)
+                         + lengths(possible_info, possible_info.frames, possible_transcript)))
         else:
-            nonlocal rejected
-            print("Transcript Rejection: " + possible_file)
-            rejected += 1
+            metrics.detail("Transcript Rejection (" + possible_reason + "): " + possible_file)
+            rejected[possible_reason] += 1
 
     # Check all speech files for validity
-    for idx, file in enumerate(files):
-        final_path = path.join(audio_path, file)
-
-        # Calculate the length of the speech file
-        speech = sf.SoundFile(final_path)
-        samples = len(speech)
-        sample_rate = speech.samplerate
-        seconds = samples/sample_rate
-
-        if "(" not in file:  # The original file is still there but we only want to account for files that are split
-            continue
-        elif seconds > MAX_SECS or seconds < MIN_SECS:
-            print("Too long Rejection: " + file)
-            rejected += 1
+    for recording, (stat, info, transcription) in zip(files, checked):
+        file = recording.name + ".wav"
+        final_path = recording.audio_path
+
+        if transcription is None:
+            seconds = info.frames/info.samplerate
+            metrics.detail("Too long Rejection: " + file)
+            rejected["too_long" if seconds > MAX_SECS else "too_short"] += 1
         else:
-            # The function returns the timestamps and the transcription for the .wav file
-            begin, end, transcript = get_transcription(file, trans_path)
+            # The timestamps and the transcription for the .wav file
+            begin, end, transcript, reason, speaker = transcription
             if possible_file is None:
                 pass
-            elif file.endswith("(000).skp"):  # When we start processing a new "big" file.
-                maybe_add(possible_file, possible_filesize, possible_transcript)
+            elif corpus_catalog.recording_id(file) != corpus_catalog.recording_id(possible_file):
+                # When we start processing a new "big" file, its timestamps have nothing to do with the previous one
+                maybe_add(possible_file, possible_filesize, possible_info, possible_transcript, possible_reason,
+                          possible_speaker)
             elif previous_end <= begin < end:
-                maybe_add(possible_file, possible_filesize, possible_transcript)
-                if idx == len(files) - 1:
-                    # Also import the current file.
-                    maybe_add(final_path, os.path.getsize(final_path), transcript)
+                maybe_add(possible_file, possible_filesize, possible_info, possible_transcript, possible_reason,
+                          possible_speaker)
             else:
-                print("Time Rejection: " + possible_file)
+                metrics.detail("Time Rejection: " + possible_file)
                 transcript = ""  # We do this so the file will also be rejected later on
-                rejected += 1
+                reason = "time"
+                rejected["time"] += 1
 
             # Set the current file as a possible candidate for importing.
             possible_file = final_path
-            possible_filesize = os.path.getsize(final_path)
+            possible_filesize = stat.st_size
+            possible_info = info
             possible_transcript = transcript
+            possible_reason = reason
+            possible_speaker = speaker
             previous_end = end
 
-    processed_data = {
-        'wav_filename': accepted_wavs,
-        'wav_filesize': accepted_wav_sizes,
-        'transcript': accepted_wav_transcripts
-    }
+    # Import the last candidate
+    if possible_file is not None:
+        maybe_add(possible_file, possible_filesize, possible_info, possible_transcript, possible_reason,
+                  possible_speaker)
 
-    # A data frame of all the processed data
-    df = pd.DataFrame(processed_data, columns=['wav_filename', 'wav_filesize', 'transcript'])
+    metrics.detail("Number of rejected files: " + str(sum(rejected.values())))
+    metrics.detail("Number of accepted files: " + str(accepted))
 
-    print("Number of rejected files: " + str(rejected))
-    print("Number of accepted files: " + str(accepted))
+    return rows, rejected
 
-    return df
 
+# This function returns the length columns of a file (or of a segment of num_frames frames of the given recording):
+# its duration, its number of samples once it is converted to the target format and the length of its transcript
+def lengths(info, num_frames, transcript, target_format=None):
+    num_samples = num_frames
+    if target_format is not None and target_format.samplerate:
+        num_samples = audio.resampled_length(num_frames, info.samplerate, target_format.samplerate)
+    return num_frames / info.samplerate, num_samples, len(transcript)
 
-# This function generates the transcription for the given audio file
-def get_transcription(audio_file, directory_path):
-    # The current filename ends with .wav but we need it to be .skp
-    filename = audio_file.split(".")[0]
-    filename += ".skp"
-    trans_path = path.join(directory_path, filename)
 
-    # If the file does not exist, it means that it has not been extracted
-    if not path.exists(trans_path):
-        zipped_file = filename + ".gz"
-        zipped_path = path.join(directory_path, zipped_file)
-        # We open the zipped file and parse the tree from it
-        with gzip.open(zipped_path) as trans_file:
-            tree = ET.parse(trans_file)
+# This function checks if the length of a speech file is accepted
+def is_accepted_length(info):
+    return MIN_SECS <= info.frames/info.samplerate <= MAX_SECS
 
-    # Otherwise the file is extracted and we can just parse instantly
-    else:
-        trans_file = open(trans_path, "r")
-        tree = ET.parse(trans_file)
 
-    root = tree.getroot()
-    # Get the beginning of the transcription.
-    overlapping = False
-    tau = root.find("tau")
-    begin = float(tau.get("tb"))
+# This function checks one speech file of the catalog: it returns its stat result, its header and its transcription
+# (see transcribe), or None instead of the transcription when the file is too long or too short
+def check_file(recording, rules, index=None):
+    stat = recording.audio_stat
+
+    # Calculate the length of the speech file, only the header of the file is read for this
+    info = corpus_index.probe_wav(recording.audio_path, stat, index)
+    if not is_accepted_length(info):
+        return stat, info, None
+    return stat, info, transcribe(corpus_index.read_taus(recording.trans_path, index, stat=recording.trans_stat), rules)
+
 
-    # Get the ending.
-    end = 0
-    for tau in root.iter("tau"):
-        curr_begin = float(tau.get("tb"))
-        curr_end = float(tau.get("te"))
+# The reader stage of the pipeline: check_file without parsing the annotation, which is only loaded
+def read_file(index_file, recording):
+    index = None if index_file is None else corpus_index.open_index(index_file)
+    stat = recording.audio_stat
+    info = corpus_index.probe_wav(recording.audio_path, stat, index)
+    if not is_accepted_length(info):
+        return stat, info, None
+    return stat, info, corpus_index.load_annotation(recording.trans_path, index, stat=recording.trans_stat)
 
-        if not end <= curr_begin < curr_end:
-            overlapping = True
-        end = curr_end
 
-    if overlapping:
-        return begin, end, ""
+# The compute stage of the pipeline: parses the loaded annotation and builds the transcription
+def inspect_file(rules, index_file, item):
+    stat, info, loaded = item
+    if loaded is None:
+        return item
+    index = None if index_file is None else corpus_index.open_index(index_file)
+    return stat, info, transcribe(corpus_index.parse_annotation(loaded, index), rules)
 
-    # Initialize the transcription.
-    transcription = ""
 
-    # All words are inside tags <tw .....> so we iterate over them
-    for tw in root.iter("tw"):
-        word = tw.get("w")
-        if word in WORDS:
-            return begin, end, False
-        for letter in word:
-            if letter in CHARACTERS:
-                return begin, end, False
+# This function generates the transcription out of the "tau" segments of a file.
+# It returns the timestamps, the transcription, the reason if the transcription was rejected (otherwise None) and the
+# speaker of most of the transcription.
+def transcribe(taus, rules):
+    if not taus:
+        return 0, 0, "", "empty", None
 
-        transcription += word + " "
+    # Get the beginning and the ending of the transcription.
+    begin = taus[0].tb
+    end = taus[-1].te
+    speaker = annotation.main_speaker(taus)
 
-    # Strip the last character which is an unnecessary space and make it all lowercase.
-    transcription = transcription[:-1].lower()
+    if annotation.is_overlapping(taus):
+        return begin, end, "", "overlap", speaker
 
     # Return the complete transcription
-    return begin, end, transcription
+    transcription, reason = normalize.normalize((word for tau in taus for word in tau.words), rules)
+    if transcription == "":
+        reason = "empty"
+    return begin, end, transcription, reason, speaker
 
 
-def check_previous(previous_end, begin, end):
-    return previous_end <= begin < end
+# This function imports the segments of a manifest written by split_cgn.py, which are served from the original
+# recordings. The same checks are done as in process_language. The sizes are the ones of the segments once they are
+# converted to the target format.
+# With a shard, only the segments of the recordings in the shard are imported.
+def process_manifest(manifest_file, writer, rules, index=None, target_format=None, shard=None):
+    accepted = 0
+    rejected = Counter()
 
+    possible = None  # The segment that will be imported if the next one does not overlap with it
+    possible_info = None
+    possible_transcript = ""
+    possible_reason = None
+    previous_end = 0
+    current_source = None
+
+    def maybe_add(segment, info, transcript, reason):
+        nonlocal accepted
+        if transcript:
+            metrics.count("accepted")
+            metrics.detail("Segment: " + segment.source_wav + " [" + str(segment.start_frame) + ", +"
+                           + str(segment.num_frames) + "] and Transcript: " + transcript)
+            accepted += 1
+            writer.add(segment.speaker, segment.source_wav, audio.wav_size(info, segment.num_frames, target_format),
+                       transcript, *lengths(info, segment.num_frames, transcript, target_format),
+                       segment.start_frame, segment.num_frames)
+        else:
+            metrics.detail("Transcript Rejection (" + reason + "): " + segment.source_wav
+                           + " [" + str(segment.start_frame) + "]")
+            rejected[reason] += 1
 
-def generate_splits(data):
-    print("Generating splits for the data")
+    for segment in manifest.read_manifest(manifest_file):
+        if not sharding.in_shard(segment.source_wav, shard):
+            continue
 
-    # Randomize the order of the data
-    data = data.sample(frac=1)
+        # Only probe the header of a recording once for all of its segments
+        new_recording = segment.source_wav != current_source
+        if new_recording:
+            info = corpus_index.probe_wav(segment.source_wav, index=index)
+            current_source = segment.source_wav
 
-    # We split into 80-20 training and testing (using the global variable TRAIN_SPLIT)
-    # Afterwards we split the 80% training data into 80-20 training validation
-    train_beg = 0
-    train_end = int(TRAIN_SPLIT * len(data))
-    dev_beg = int(TRAIN_SPLIT * train_end)
-    dev_end = train_end
-    train_end = dev_beg
-    test_beg = dev_end
-    test_end = len(data)
-
-    # Make the splits
-    train_data = data[train_beg:train_end]
-    dev_data = data[dev_beg:dev_end]
-    test_data = data[test_beg:test_end]
-
-    # We write the splits
-    print("Writing training split")
-    with open(FILENAME_TRAIN, 'a') as f:
-        # We only want to write the header the first time, hence the quick check "header = ..."
-        train_data.to_csv(f, sep=',', mode='a', header=True, index=False, encoding="ascii")
-
-    print("Writing validation split")
-    with open(FILENAME_DEV, 'a') as f:
-        # We only want to write the header the first time, hence the quick check "header = ..."
-        dev_data.to_csv(f, sep=',', mode='a', header=True, index=False, encoding="ascii")
-
-    print("Writing test split")
-    with open(FILENAME_TEST, 'a') as f:
-        # We only want to write the header the first time, hence the quick check "header = ..."
-        test_data.to_csv(f, sep=',', mode='a', header=True, index=False, encoding="ascii")
+        seconds = segment.num_frames / info.samplerate
+        if seconds > MAX_SECS or seconds < MIN_SECS:
+            metrics.detail("Too long Rejection: " + segment.source_wav + " [" + str(segment.start_frame) + "]")
+            rejected["too_long" if seconds > MAX_SECS else "too_short"] += 1
+            continue
 
+        begin = segment.start_frame / info.samplerate
+        end = begin + seconds
 
-if __name__ == "__main__":
-    print("Starting the preprocessing of the data")
+        # An empty transcript in the manifest means the "tau" segments overlap
+        if segment.transcript:
+            transcript, reason = normalize.normalize(segment.transcript.split(), rules)
+        else:
+            transcript, reason = "", "overlap"
 
-    # Starting the parser for the command line arguments
+        if possible is not None:
+            # The first segment of a recording that is not rejected for its length starts again, whatever came before
+            if possible.source_wav != segment.source_wav or previous_end <= begin < end:
+                maybe_add(possible, possible_info, possible_transcript, possible_reason)
+            else:
+                metrics.detail("Time Rejection: " + possible.source_wav + " [" + str(possible.start_frame) + "]")
+                transcript = ""  # We do this so the segment will also be rejected later on
+                reason = "time"
+                rejected["time"] += 1
+
+        # Set the current segment as a possible candidate for importing.
+        possible = segment
+        possible_info = info
+        possible_transcript = transcript
+        possible_reason = reason
+        previous_end = end
+
+    # Import the last candidate
+    if possible is not None:
+        maybe_add(possible, possible_info, possible_transcript, possible_reason)
+
+    metrics.log("Number of rejected segments: " + str(sum(rejected.values())))
+    metrics.log("Number of accepted segments: " + str(accepted))
+    print_rejections(rejected)
+
+
+def check_previous(previous_end, begin, end):
+    return previous_end <= begin < end
+
+
+# This function maps a name to a number in [0, 1). It is a hash of the name only, so it is the same in every run and
+# on every machine (unlike hash(), which is salted per process).
+def stable_fraction(name):
+    digest = hashlib.sha1(name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+# This class streams the accepted files to the CSV files of the splits. Every file is assigned to a split when it gets
+# accepted and the rows are kept in a small buffer with one list per column, which is written out every CHUNK_SIZE rows.
+# This way we never hold (or copy) all the data in memory.
+# The split only depends on the recording (or the speaker) of the file, so all the segments of a recording end up in
+# the same split, a new run gives the same splits and adding data does not move the files that were already there.
+class SplitWriter:
+    def __init__(self, filenames, columns=COLUMNS, chunk_size=CHUNK_SIZE, group_by="recording"):
+        self.filenames = filenames
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.group_by = group_by
+        self.buffers = {split: {column: [] for column in columns} for split in filenames}
+        self.counts = {split: 0 for split in filenames}
+
+        # Start every split with just the header
+        for filename in filenames.values():
+            with open(filename, 'w') as f:
+                pd.DataFrame(columns=columns).to_csv(f, sep=',', index=False)
+
+    # We split into 80-20 training and testing (using the global variable TRAIN_SPLIT)
+    # Afterwards we split the 80% training data into 80-20 training validation
+    # Files without a known speaker are divided by their recording.
+    def choose_split(self, wav_filename, speaker=None):
+        if self.group_by == "speaker" and speaker:
+            draw = stable_fraction("speaker:" + speaker)
+        else:
+            draw = stable_fraction("recording:" + corpus_catalog.recording_id(wav_filename))
+        if draw < TRAIN_SPLIT * TRAIN_SPLIT:
+            return "train"
+        elif draw < TRAIN_SPLIT:
+            return "dev"
+        return "test"
+
+    # Add one row of the given speaker, with a value for every column
+    def add(self, speaker, *row):
+        split = self.choose_split(row[0], speaker)
+        buffer = self.buffers[split]
+        for column, value in zip(self.columns, row):
+            buffer[column].append(value)
+        self.counts[split] += 1
+        if len(buffer['wav_filename']) >= self.chunk_size:
+            self.flush(split)
+
+    # Append the buffered rows of a split to its file and empty the buffer
+    def flush(self, split):
+        buffer = self.buffers[split]
+        if not buffer['wav_filename']:
+            return
+        with metrics.timer("csv_write"), open(self.filenames[split], 'a') as f:
+            pd.DataFrame(buffer, columns=self.columns).to_csv(f, sep=',', header=False, index=False)
+        for column in buffer.values():
+            column.clear()
+
+    def close(self):
+        for split in self.buffers:
+            self.flush(split)
+
+
+# This function builds the parser for the command line arguments, preprocess.py uses it for the defaults as well
+def get_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("target", help="the top level target directory")
     parser.add_argument("--components", nargs='+', help="restrict the used data to a specified component")
     parser.add_argument("--language", help="choose a single language for the model")
-    args = parser.parse_args()
+    parser.add_argument("--workers", type=int, default=1, help="the number of processes importing languages in parallel")
+    parser.add_argument("--manifest", help="import the segments in this manifest written by split_cgn.py --manifest")
+    parser.add_argument("--no-clean", action="store_true",
+                        help="do not replace or drop the characters clean_data.py takes care of")
+    parser.add_argument("--index", default=corpus_index.INDEX_FILE, help="the file with the cached annotation index")
+    parser.add_argument("--no-index", action="store_true", help="always parse the annotations, without using the index")
+    parser.add_argument("--samplerate", type=int, help="the sample rate the segments of the manifest are converted to")
+    parser.add_argument("--channels", type=int,
+                        help="the number of channels the segments of the manifest are converted to")
+    parser.add_argument("--sample-width", type=int, choices=sorted(audio.SUBTYPES),
+                        help="the bytes per sample the segments of the manifest are converted to")
+    parser.add_argument("--group-by", choices=GROUP_BY, default="recording",
+                        help="keep all the files of a recording or of a speaker in the same split")
+    parser.add_argument("--catalog", help="use the catalog saved in this file instead of scanning the target")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="THREADS",
+                        help="read and parse the files in overlapping stages with this many threads each")
+    parser.add_argument("--length-order", choices=buckets.ORDERS,
+                        help="also write the splits sorted by duration or grouped in buckets, with a histogram of the "
+                             "durations in " + buckets.HISTOGRAM_FILE)
+    parser.add_argument("--bucket-width", type=float, default=buckets.BUCKET_WIDTH,
+                        help="the width of a bucket (and of the bars of the histogram) in seconds")
+    parser.add_argument("--shard", type=sharding.parse_shard, metavar="i/N",
+                        help="only import the recordings in the i-th of N shards, to separate files per shard")
+    parser.add_argument("--quiet", action="store_true", help="only print the results")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every file")
+    parser.add_argument("--metrics", help="write the counters and timers to this JSON file")
+    return parser
+
+
+if __name__ == "__main__":
+    # Starting the parser for the command line arguments
+    args = get_parser().parse_args()
+
+    metrics.configure(args.quiet, args.verbose)
+    metrics.log("Starting the preprocessing of the data")
 
     # Getting rid of the previous CSV files if they exist
-    if os.path.exists(FILENAME_TRAIN):
-        os.remove(FILENAME_TRAIN)
-    if os.path.exists(FILENAME_DEV):
-        os.remove(FILENAME_DEV)
-    if os.path.exists(FILENAME_TEST):
-        os.remove(FILENAME_TEST)
+    for filename in split_filenames(args.shard).values():
+        if os.path.exists(filename):
+            os.remove(filename)
 
     preprocess_data(args)
 
-    print("Completed successfully")
+    metrics.summarize(args.metrics)
+    metrics.log("Completed successfully")
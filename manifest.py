@@ -0,0 +1,75 @@
+import os
+import csv
+from collections import namedtuple
+import audio
+import metrics
+
+# The default file the segments are written to when split_cgn.py does not cut the recordings
+MANIFEST_FILE = "segments.csv"
+
+# One segment of a recording: the original file, the first frame, the number of frames, the transcript and the speaker
+# of most of the segment. The transcript is empty when the "tau" segments in it overlap.
+Segment = namedtuple("Segment", ["source_wav", "start_frame", "num_frames", "transcript", "speaker"])
+
+
+# This function starts a new manifest with only the header
+def create_manifest(manifest_file):
+    with open(manifest_file, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerow(Segment._fields)
+
+
+# This function appends segments to a manifest. They are on disk before split_cgn.py marks their recording as finished
+# in its journal.
+def write_segments(manifest_file, segments):
+    with metrics.timer("manifest_write"), open(manifest_file, "a", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(segments)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# This function removes the segments of every recording that is not in the given ones from a manifest. A run that
+# stopped between writing the segments of a recording and marking it as finished left them behind, and they would be
+# written again when the recording is split again. It returns the number of removed segments.
+def keep_segments(manifest_file, sources):
+    removed = 0
+    with open(manifest_file, newline="", encoding="utf-8") as f, \
+            open(manifest_file + ".part", "w", newline="", encoding="utf-8") as out:
+        reader = csv.reader(f)
+        writer = csv.writer(out)
+        writer.writerow(next(reader))
+        for row in reader:
+            if row and row[0] in sources:
+                writer.writerow(row)
+            else:
+                removed += 1
+    os.replace(manifest_file + ".part", manifest_file)
+    return removed
+
+
+# This generator streams over the segments in a manifest. Manifests written before the speaker was added have no
+# speaker column, their segments get an empty speaker.
+def read_manifest(manifest_file):
+    with open(manifest_file, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        next(reader)  # Skip the header
+        for row in reader:
+            speaker = row[4] if len(row) > 4 else ""
+            yield Segment(row[0], int(row[1]), int(row[2]), row[3], speaker)
+
+
+# This generator serves the samples of every segment in a manifest, read lazily from the original recordings and
+# converted to the target format if one is given.
+# Consecutive segments of the same recording share one opened file, we only seek to the first frame of every segment.
+def iter_segments(manifest_file, target=None):
+    audio_file = None
+    try:
+        for segment in read_manifest(manifest_file):
+            if audio_file is None or audio_file.name != segment.source_wav:
+                if audio_file is not None:
+                    audio_file.close()
+                audio_file = audio.open_audio(segment.source_wav)
+            data, _, _ = audio.read_converted(audio_file, segment.start_frame, segment.num_frames, target)
+            yield segment, data
+    finally:
+        if audio_file is not None:
+            audio_file.close()
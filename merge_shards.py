@@ -0,0 +1,162 @@
+import os
+from os import path
+import argparse
+import csv
+import heapq
+from functools import partial
+import numpy as np
+import count_files
+import sharding
+
+# The order of the languages in the CSV files of import_cgn.py, which imports the Flemish recordings first
+IMPORT_LANGUAGES = {"vl": 0, "nl": 1}
+
+
+# This function merges the files of all the shards of every given file, in the order a single run would have written
+def merge(args):
+    failed = 0
+    for filename in args.files:
+        shard_files = [sharding.shard_file(filename, (i, args.shards)) for i in range(args.shards)]
+
+        # Only merge complete shards: a missing or changed checksum means the node did not finish
+        incomplete = [f for f in shard_files if not path.exists(f) or not sharding.verify_checksum(f)]
+        if incomplete:
+            print("Not merging " + filename + ", these shards are missing or incomplete: " + ", ".join(incomplete))
+            failed += 1
+            continue
+
+        # Text files (the journal and the failed files of split_cgn.py) are simply put after each other
+        temp_file = filename + ".part"
+        if not filename.endswith(".csv"):
+            concatenate(shard_files, temp_file)
+        else:
+            first_line = read_header(shard_files)
+            if first_line is None:
+                print("Not merging " + filename + ", the shards do not have the same header")
+                failed += 1
+                continue
+
+            # The rows are written with the same line endings as the shards: pandas uses \n, the csv module \r\n
+            header = first_line.rstrip("\r\n")
+            terminator = first_line[len(header):] or "\n"
+            if header == "kind,duration,segments,seconds":
+                merge_counts(shard_files, temp_file, args.sweep_output)
+            elif header.startswith("path,"):
+                merge_rows(shard_files, temp_file, report_key, terminator)
+            elif header.startswith("source_wav,"):
+                merge_rows(shard_files, temp_file, manifest_key, terminator)
+            elif "start_frame" in header:
+                key = partial(import_manifest_key, header.split(",").index("start_frame"))
+                merge_rows(shard_files, temp_file, key, terminator)
+            else:
+                merge_rows(shard_files, temp_file, import_key, terminator)
+        os.replace(temp_file, filename)
+
+        checksum = sharding.write_checksum(filename)
+        print("Merged " + str(args.shards) + " shards into " + filename + " (sha256 " + checksum + ")")
+
+    return 1 if failed else 0
+
+
+# This function returns the first line of the shards if it is the same in all of them, otherwise None
+def read_header(shard_files):
+    headers = set()
+    for shard_file in shard_files:
+        with open(shard_file, newline="", encoding="utf-8") as f:
+            headers.add(f.readline())
+    return headers.pop() if len(headers) == 1 else None
+
+
+# This function splits the path of a recording (or one of its segments) in its component, language and file name
+def split_path(wav_filename):
+    directory, name = path.split(wav_filename)
+    directory, language = path.split(directory)
+    return path.basename(directory), language, name
+
+
+# The order of the rows import_cgn.py writes: per component, the Flemish files and then the Dutch ones
+def import_key(row):
+    component, language, name = split_path(row[0])
+    return component, IMPORT_LANGUAGES.get(language, len(IMPORT_LANGUAGES)), language, name
+
+
+# The order of the recordings in the report of split_cgn.py
+def report_key(row):
+    return split_path(row[0])
+
+
+# The order of the segments in a manifest written by split_cgn.py: per recording, by first frame
+def manifest_key(row):
+    return split_path(row[0]) + (int(row[1]),)
+
+
+# The order of the rows import_cgn.py writes for the segments of a manifest, the same as in the manifest
+def import_manifest_key(start_column, row):
+    return split_path(row[0]) + (int(row[start_column]),)
+
+
+# This function merges the rows of CSV files that are each sorted on the given key, the header is written once.
+# Every shard is a part of the rows of a single run in the same order, so the merge gives back the order of that run.
+def merge_rows(shard_files, output_file, key, terminator="\n"):
+    files = [open(f, newline="", encoding="utf-8") for f in shard_files]
+    try:
+        readers = [csv.reader(f) for f in files]
+        header = [next(reader) for reader in readers][0]
+        with open(output_file, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f, lineterminator=terminator)
+            writer.writerow(header)
+            writer.writerows(heapq.merge(*readers, key=key))
+    finally:
+        for f in files:
+            f.close()
+
+
+# This function adds up the counts of the shards of count_files.py, prints the result like a single run and writes
+# the sweep if the shards counted one
+def merge_counts(shard_files, output_file, sweep_output):
+    rows = {}
+    for shard_file in shard_files:
+        with open(shard_file, newline="") as f:
+            for row in csv.DictReader(f):
+                key = (row["kind"], float(row["duration"]))
+                segments, seconds = rows.get(key, (0, 0.0))
+                rows[key] = (segments + int(row["segments"]), seconds + float(row["seconds"]))
+
+    count_files.write_counts(output_file, [(kind, duration, segments, seconds)
+                                           for (kind, duration), (segments, seconds) in rows.items()])
+
+    for (kind, duration), (segments, _) in rows.items():
+        if kind == "duration":
+            count_files.print_result(duration, segments * count_files.FILES_PER_SEGMENT)
+
+    sweep = [(duration, segments, seconds) for (kind, duration), (segments, seconds) in rows.items() if kind == "sweep"]
+    if sweep:
+        thresholds, segments, seconds = (np.array(column) for column in zip(*sweep))
+        count_files.write_sweep(thresholds, segments, seconds, sweep_output)
+
+
+# This function writes the lines of all the shards after each other
+def concatenate(shard_files, output_file):
+    with open(output_file, "w", newline="", encoding="utf-8") as out:
+        for shard_file in shard_files:
+            with open(shard_file, newline="", encoding="utf-8") as f:
+                out.writelines(f)
+
+
+if __name__ == "__main__":
+    print("Starting the merging of the shards")
+
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="+",
+                        help="the files to merge, as they are named without sharding (e.g. train_data.csv), the shards "
+                             "are found next to them")
+    parser.add_argument("--shards", type=int, required=True, help="the number of shards N the files were written in")
+    parser.add_argument("--sweep-output", default=count_files.SWEEP_FILE,
+                        help="the CSV file the merged sweep of count_files.py is written to")
+    args = parser.parse_args()
+
+    code = merge(args)
+    if code == 0:
+        print("Completed successfully")
+    raise SystemExit(code)
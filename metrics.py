@@ -0,0 +1,101 @@
+import json
+import time
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+# The counters (rejections, files, ...) and the timers (total seconds and number of calls) of this process
+counters = Counter()
+seconds = Counter()
+calls = Counter()
+
+# The threads of a pipeline (see stages.py) update the same counters
+_lock = threading.Lock()
+
+# quiet: only print errors, verbose: also print a line for every file
+settings = {"quiet": False, "verbose": False}
+started = time.perf_counter()
+
+
+# This function sets the output mode. It is also used as the initializer of the worker processes.
+def configure(quiet=False, verbose=False):
+    settings["quiet"] = quiet
+    settings["verbose"] = verbose
+
+
+# This function prints a message, unless we are in the quiet mode
+def log(message):
+    if not settings["quiet"]:
+        print(message)
+
+
+# This function prints a message about a single file, only in the verbose mode
+def detail(message):
+    if settings["verbose"] and not settings["quiet"]:
+        print(message)
+
+
+def count(name, amount=1):
+    with _lock:
+        counters[name] += amount
+
+
+# This context manager adds the time spent in it to the timer with the given name
+@contextmanager
+def timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            seconds[name] += elapsed
+            calls[name] += 1
+
+
+def snapshot():
+    return {"counters": dict(counters), "seconds": dict(seconds), "calls": dict(calls)}
+
+
+def reset():
+    counters.clear()
+    seconds.clear()
+    calls.clear()
+
+
+# This function adds the metrics of another process (or task) to the ones of this process
+def merge(other):
+    counters.update(other["counters"])
+    seconds.update(other["seconds"])
+    calls.update(other["calls"])
+
+
+# This function calls the given function and returns its result together with only the metrics it produced.
+# Workers use this so the main process can merge the metrics of every task exactly once.
+def collect(function, *args):
+    saved = snapshot()
+    reset()
+    try:
+        result = function(*args)
+    finally:
+        own = snapshot()
+        reset()
+        merge(saved)
+    return result, own
+
+
+# This function prints the counters and timers, and writes them to a JSON file if one is given
+def summarize(metrics_file=None):
+    wall = time.perf_counter() - started
+    log("Wall time: %.2f seconds" % wall)
+    for name, value in sorted(counters.items()):
+        log("  %-32s %d" % (name, value))
+    for name, value in sorted(seconds.items()):
+        log("  %-32s %.2f seconds in %d calls" % (name, value, calls[name]))
+
+    if metrics_file:
+        summary = snapshot()
+        summary["wall_seconds"] = wall
+        with open(metrics_file, "w") as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+        log("Written the metrics to " + metrics_file)
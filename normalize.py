@@ -0,0 +1,55 @@
+import re
+from collections import namedtuple
+
+# Words that we do not want to have in our transcription, a transcription with one of them is rejected
+WORDS = ["ggg", "Xxx", "xxx"]
+
+# Forbidden characters that we do not want to have in our transcription
+CHARACTERS = ["0", "1", "2", "3", "4", "5", "6", "7", "8", "9"]
+
+# The characters that are replaced in the (lowercase) transcription, and the characters of which a single one rejects
+# the transcription. This way the transcriptions fit the alphabet used by the English models provided by DeepSpeech.
+REPLACE = {"-": " "}  # Replace - by a space
+DROP = ["&"]  # Drop all transcriptions containing a &
+
+# The compiled rules: a set of words, a regex for the characters, a translation table and a regex for the drops.
+# The regexes are None when there are no characters.
+Rules = namedtuple("Rules", ["words", "characters", "table", "drop"])
+
+
+# This function builds a regex that matches any of the given characters
+def compile_characters(characters):
+    if not characters:
+        return None
+    return re.compile("[" + "".join(re.escape(character) for character in characters) + "]")
+
+
+# This function compiles the rules once, so every transcription can be checked with a set lookup per word, two regex
+# searches and one str.translate
+def compile_rules(words=WORDS, characters=CHARACTERS, replace=REPLACE, drop=DROP):
+    return Rules(frozenset(words), compile_characters(characters), str.maketrans(replace), compile_characters(drop))
+
+
+# The rules of the importer only, without the replacements and drops that clean_data.py used to do afterwards
+def importer_rules():
+    return compile_rules(replace={}, drop=[])
+
+
+# This function builds the transcription out of the given words.
+# It returns the transcription and None, or None and the name of the rule that rejected it.
+def normalize(words, rules):
+    words = list(words)
+    for word in words:
+        if word in rules.words:
+            return None, "forbidden_word"
+
+    transcription = " ".join(words)
+    if rules.characters is not None and rules.characters.search(transcription):
+        return None, "forbidden_character"
+
+    # Make it all lowercase and replace the characters that are not in the alphabet
+    transcription = transcription.lower().translate(rules.table)
+    if rules.drop is not None and rules.drop.search(transcription):
+        return None, "dropped_character"
+
+    return transcription, None
@@ -0,0 +1,221 @@
+import os
+from os import path
+import argparse
+import hashlib
+import json
+import types
+import audio
+import clean_data
+import corpus_catalog
+import corpus_index
+import count_files
+import import_cgn
+import metrics
+import sharding
+import split_cgn
+
+# The file in which the fingerprints of the inputs of every stage are kept, to skip the stages that are up to date
+STATE_FILE = "preprocess_state.json"
+
+# The stages in the order they run. The import uses the segments of the split and the cleaning the splits of the
+# import. The count is independent of them, it runs after the split so it finds the annotations in the index: the split
+# parses them with their XML, which the count does not need.
+STAGES = ["split", "count", "import", "clean"]
+
+# The options that do not change the outputs of a stage, only how fast it runs or what it prints
+VOLATILE_OPTIONS = {"workers", "pipeline", "validate_threads", "quiet", "verbose", "metrics"}
+
+# The code of every stage is part of its fingerprint, so a change of DURATION, WIDTH or the rules runs it again. The
+# code of a stage is its script and every module of this project it imports, directly or through another module.
+STAGE_MODULES = {"count": count_files, "split": split_cgn, "import": import_cgn, "clean": clean_data}
+
+
+# This function runs the stages in one process. The corpus is scanned once (and once more after the split, to find the
+# new segments), the annotations are parsed once into the index, and split_cgn.py stores the headers and annotations of
+# the segments it writes in the index so the import does not read them again. A stage whose inputs did not change since
+# the last run is skipped.
+def preprocess(args):
+    state = {} if args.force else load_state(args.state)
+    common = [args.target] + (["--no-index"] if args.no_index else ["--index", args.index])
+    workers = ["--workers", str(args.workers), "--pipeline", str(args.pipeline)]
+
+    metrics.log("Scanning " + args.target)
+    catalog = corpus_catalog.scan(args.target)
+    catalog.report()
+
+    if "split" in args.stages:
+        split_args = split_cgn.get_parser().parse_args(common + workers + format_options(args))
+        inputs = fingerprint(catalog.originals(), "split", split_args)
+        segments = fingerprint(catalog.segments(), "segments")
+        if is_up_to_date(state.get("split"), inputs) and state["split"]["segments"] == segments:
+            metrics.log("Skipping the split, the recordings and their segments did not change")
+        else:
+            start_stage("split")
+            failed = split_cgn.split_files(split_args, catalog)
+
+            # Only the segments of the split are new, a scan of the directories is enough to find them
+            catalog = corpus_catalog.scan(args.target)
+            if failed:
+                metrics.log("Not remembering the split because " + str(len(failed)) + " recordings failed")
+                state.pop("split", None)
+            else:
+                segments = fingerprint(catalog.segments(), "segments")
+                state["split"] = {"inputs": inputs, "files": {}, "segments": segments}
+            save_state(args.state, state)
+
+    if "count" in args.stages:
+        sweep = ["--sweep"] + [str(x) for x in args.sweep] if args.sweep else []
+        count_args = count_files.get_parser().parse_args(common + ["--duration", str(args.duration)] + sweep)
+        inputs = fingerprint(catalog.originals(), "count", count_args)
+        outputs = [count_args.sweep_output] if args.sweep else []
+        if is_up_to_date(state.get("count"), inputs, outputs):
+            metrics.log("Skipping the count, the annotations did not change")
+            count_files.print_result(count_args.duration, state["count"]["num_files"])
+        else:
+            start_stage("count")
+            num_files = count_files.count_files(count_args, catalog)
+            state["count"] = {"inputs": inputs, "files": checksums(outputs), "num_files": num_files}
+            save_state(args.state, state)
+
+    if "import" in args.stages:
+        import_args = import_cgn.get_parser().parse_args(common + workers + (["--no-clean"] if args.no_clean else []))
+        inputs = fingerprint(catalog.segments(), "import", import_args)
+        outputs = list(import_cgn.split_filenames().values())
+        if is_up_to_date(state.get("import"), inputs, outputs):
+            metrics.log("Skipping the import, the segments did not change")
+        else:
+            start_stage("import")
+            import_cgn.preprocess_data(import_args, catalog)
+            state["import"] = {"inputs": inputs, "files": checksums(outputs)}
+            save_state(args.state, state)
+
+    # The rows of the splits are built with all the rules of normalize.py, which include the ones of clean_data.py, and
+    # only from files in the catalog. So unless the import left the rules out, they are clean already and there is no
+    # CSV to read again.
+    if "clean" in args.stages:
+        if not args.no_clean:
+            metrics.log("Skipping the cleaning, the import already applied the rules of clean_data.py")
+        else:
+            split_files = [f for f in import_cgn.split_filenames().values() if path.exists(f)]
+            inputs = {"corpus": fingerprint(catalog.recordings, "clean"), "files": checksums(split_files)}
+            outputs = [clean_data.cleaned_file(f) for f in split_files]
+            if is_up_to_date(state.get("clean"), inputs, outputs):
+                metrics.log("Skipping the cleaning, the splits did not change")
+            else:
+                start_stage("cleaning")
+                for split_file in split_files:
+                    clean_data.clean(clean_data.get_parser().parse_args([split_file, "--target", args.target]), catalog)
+                state["clean"] = {"inputs": inputs, "files": checksums(outputs)}
+                save_state(args.state, state)
+
+
+def start_stage(name):
+    metrics.log("=========================================================")
+    metrics.log("Running the " + name)
+
+
+# This function returns the files of the code of a stage: the file of the module and of every module of this project it
+# imports, directly or through another module
+def stage_code(module, found=None):
+    found = set() if found is None else found
+    found.add(module.__file__)
+    for value in vars(module).values():
+        if isinstance(value, types.ModuleType) and is_local(value) and value.__file__ not in found:
+            stage_code(value, found)
+    return sorted(found)
+
+
+# This function checks if a module is one of this project, next to this script
+def is_local(module):
+    filename = getattr(module, "__file__", None)
+    return filename is not None and path.dirname(path.abspath(filename)) == path.dirname(path.abspath(__file__))
+
+
+# This function returns the options of the split for the format of the segments
+def format_options(args):
+    options = []
+    for option, value in (("--samplerate", args.samplerate), ("--channels", args.channels),
+                          ("--sample-width", args.sample_width)):
+        if value is not None:
+            options += [option, str(value)]
+    return options
+
+
+# This function calculates the fingerprint of the inputs of a stage: the size and modification time of every file of
+# the given recordings, the options of the stage and the code it runs
+def fingerprint(recordings, stage, stage_args=None):
+    options = {} if stage_args is None else vars(stage_args)
+    options = {key: value for key, value in options.items() if key not in VOLATILE_OPTIONS}
+    checksum = hashlib.sha1()
+    checksum.update(json.dumps(options, sort_keys=True, default=str).encode("utf-8"))
+    for filename in stage_code(STAGE_MODULES[stage]) if stage in STAGE_MODULES else []:
+        checksum.update(sharding.file_checksum(filename).encode("utf-8"))
+    for r in recordings:
+        checksum.update("\t".join([r.audio_path, str(tuple(r.audio_stat)), str(r.trans_path),
+                                   str(tuple(r.trans_stat or ()))]).encode("utf-8") + b"\n")
+    return checksum.hexdigest()
+
+
+# This function returns the checksums of the output files of a stage
+def checksums(filenames):
+    return {filename: sharding.file_checksum(filename) for filename in filenames}
+
+
+# This function checks if a stage can be skipped: it ran before with the same inputs and its output files did not change
+def is_up_to_date(stage_state, inputs, outputs=()):
+    if stage_state is None or stage_state["inputs"] != inputs:
+        return False
+    if sorted(stage_state["files"]) != sorted(outputs):
+        return False
+    return all(path.exists(f) and sharding.file_checksum(f) == checksum for f, checksum in stage_state["files"].items())
+
+
+def load_state(state_file):
+    if not path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+# This function writes the state to a temporary file first, so a crash never leaves half of it behind
+def save_state(state_file, state):
+    temp_file = state_file + ".part"
+    with open(temp_file, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(temp_file, state_file)
+
+
+if __name__ == "__main__":
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="the top level target directory")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, help="the stages to run")
+    parser.add_argument("--force", action="store_true", help="run the stages even when their inputs did not change")
+    parser.add_argument("--state", default=STATE_FILE, help="the file with the fingerprints of the last run")
+    parser.add_argument("--duration", type=float, default=count_files.DURATION,
+                        help="the minimum duration of a file in seconds for the count")
+    parser.add_argument("--sweep", type=float, nargs=3, metavar=("START", "STOP", "STEP"),
+                        help="also count the files for every duration from START to STOP (inclusive)")
+    parser.add_argument("--no-clean", action="store_true",
+                        help="import the transcripts without the rules of clean_data.py, and clean the splits after it")
+    parser.add_argument("--workers", type=int, default=1, help="the processes used by the split and the import")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="THREADS",
+                        help="run the split and the import in overlapping stages with this many threads each")
+    parser.add_argument("--samplerate", type=int, help="resample the segments to this sample rate")
+    parser.add_argument("--channels", type=int, help="mix the segments down (or up) to this number of channels")
+    parser.add_argument("--sample-width", type=int, choices=sorted(audio.SUBTYPES),
+                        help="write the segments with this many bytes per sample")
+    parser.add_argument("--index", default=corpus_index.INDEX_FILE, help="the file with the cached annotation index")
+    parser.add_argument("--no-index", action="store_true", help="always parse the annotations, without using the index")
+    parser.add_argument("--quiet", action="store_true", help="only print the results")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every file")
+    parser.add_argument("--metrics", help="write the counters and timers to this JSON file")
+    args = parser.parse_args()
+
+    metrics.configure(args.quiet, args.verbose)
+    metrics.log("Starting the preprocessing of the corpus")
+
+    preprocess(args)
+
+    metrics.summarize(args.metrics)
+    metrics.log("Completed successfully")
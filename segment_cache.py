@@ -0,0 +1,95 @@
+import os
+from os import path
+import hashlib
+import shutil
+import threading
+import metrics
+
+# The default directory of the cache and its default size in MB
+CACHE_DIR = "cgn_segment_cache"
+CACHE_SIZE = 10240
+
+
+# This function calculates the SHA-1 hash of the content of a file, reading it in blocks
+def hash_file(filename):
+    checksum = hashlib.sha1()
+    with metrics.timer("source_hash"), open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+# This function returns the key of a segment: the hash of the content of the original recording, the begin and end of
+# the segment and the format it is written in. The same span of the same recording always gets the same key, whatever
+# the name of the segment is.
+def segment_key(source_hash, begin, end, target_format=None):
+    fields = [source_hash, repr(float(begin)), repr(float(end)), repr(tuple(target_format) if target_format else None)]
+    return hashlib.sha1(":".join(fields).encode("utf-8")).hexdigest()
+
+
+# The file of a segment in the cache, spread over 256 directories so none of them gets too large
+def cache_path(cache_dir, key):
+    return path.join(cache_dir, key[:2], key + ".wav")
+
+
+# This function returns the file of the segment with the given key in the cache, or None if it is not cached
+def lookup(cache_dir, key):
+    cached = cache_path(cache_dir, key)
+    if path.exists(cached):
+        metrics.count("cache_hits")
+        return cached
+    metrics.count("cache_misses")
+    return None
+
+
+# This function puts a cached segment at the new path. The segment is touched, so the cache knows it was used recently.
+def fetch(cached, new_path):
+    link_file(cached, new_path)
+    os.utime(cached)
+
+
+# This function adds a segment that was just written to the cache
+def store(cache_dir, key, new_path):
+    cached = cache_path(cache_dir, key)
+    os.makedirs(path.dirname(cached), exist_ok=True)
+    link_file(new_path, cached)
+
+
+# This function makes a hard link of a file, or a copy when the destination is on another file system. The link is made
+# under a temporary name first, so an existing destination is replaced at once. A destination that already is a link to
+# the source is left alone: renaming a link onto another link to the same file does nothing, which would leave the
+# temporary link behind.
+def link_file(source, destination):
+    if path.exists(destination) and path.exists(source) and path.samefile(source, destination):
+        return
+    temp_path = destination + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + ".part"
+    try:
+        os.link(source, temp_path)
+    except OSError:
+        shutil.copyfile(source, temp_path)  # Raises FileNotFoundError too when there is no source
+    os.replace(temp_path, destination)
+
+
+# This function removes the least recently used segments until the cache is no larger than the given number of bytes.
+# It returns the number of removed segments.
+def evict(cache_dir, max_bytes):
+    entries = []
+    total = 0
+    if not path.isdir(cache_dir):
+        return 0
+    for directory in os.scandir(cache_dir):
+        if directory.is_dir():
+            for entry in os.scandir(directory.path):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+                total += stat.st_size
+
+    removed = 0
+    for _, size, filename in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(filename)
+        total -= size
+        removed += 1
+    metrics.count("cache_evictions", removed)
+    return removed
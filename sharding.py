@@ -0,0 +1,74 @@
+import argparse
+import hashlib
+from os import path
+import corpus_catalog
+
+# Every file written for a shard gets one of these next to it, in the format of sha256sum
+CHECKSUM_EXTENSION = ".sha256"
+
+
+# This function reads a shard given as "i/N" on the command line: the i-th of N shards, counting from 0
+def parse_shard(text):
+    try:
+        index, count = (int(x) for x in text.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("a shard is given as i/N, for example 0/4")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError("the shard i/N needs 0 <= i < N")
+    return index, count
+
+
+# This function returns the shard of a recording (or of one of its segments). It is a hash of the name of the original
+# recording only, so every node computes the same shards and all the segments of a recording are in the same shard.
+def shard_of(name, count):
+    digest = hashlib.sha1(("shard:" + corpus_catalog.recording_id(name)).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count
+
+
+# This function checks if a recording is in the given shard, every recording is in the shard None (no sharding)
+def in_shard(name, shard):
+    return shard is None or shard_of(name, shard[1]) == shard[0]
+
+
+# This function returns the part of the catalog that is in the given shard
+def select(catalog, shard):
+    if shard is None:
+        return catalog
+    recordings = [r for r in catalog.recordings if in_shard(r.name, shard)]
+    orphans = [a for a in catalog.orphan_annotations if in_shard(a.name, shard)]
+    return corpus_catalog.Catalog(catalog.target, recordings, orphans)
+
+
+# This function returns the name of the output file of a shard, e.g. segments.shard-1-of-4.csv for segments.csv
+def shard_file(filename, shard):
+    if shard is None:
+        return filename
+    root, extension = path.splitext(filename)
+    return root + ".shard-" + str(shard[0]) + "-of-" + str(shard[1]) + extension
+
+
+# This function calculates the SHA-256 checksum of a file, reading it in blocks
+def file_checksum(filename):
+    checksum = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+# This function writes the checksum of a finished output file next to it
+def write_checksum(filename):
+    checksum = file_checksum(filename)
+    with open(filename + CHECKSUM_EXTENSION, "w") as f:
+        f.write(checksum + "  " + path.basename(filename) + "\n")
+    return checksum
+
+
+# This function checks a file against the checksum written next to it. It returns False when the file changed or the
+# checksum is missing, for example when the node writing the shard did not finish.
+def verify_checksum(filename):
+    if not path.exists(filename + CHECKSUM_EXTENSION):
+        return False
+    with open(filename + CHECKSUM_EXTENSION) as f:
+        expected = f.read().split()[0]
+    return file_checksum(filename) == expected
@@ -0,0 +1,132 @@
+import os
+from os import path
+import io
+import csv
+import tarfile
+from collections import namedtuple
+import soundfile as sf  # This module is used to decode the samples in the shards
+import metrics
+
+# A shard is started when the current one gets bigger than this many bytes
+SHARD_SIZE = 512 * 1024 * 1024
+
+# Where the audio of one sample is in the shards: the key, the shard file (relative to the index), the offset and the
+# size of the WAV data in the shard and the transcript
+Sample = namedtuple("Sample", ["key", "shard", "offset", "size", "transcript"])
+
+
+# This function returns the name of the index file of the shards with the given prefix
+def index_name(prefix):
+    return prefix + ".index.csv"
+
+
+# This class packs samples (a WAV file and its transcript) into large tar shards, so that a training data loader can
+# read them sequentially instead of opening one small file per sample. Every sample is stored as <key>.wav and
+# <key>.txt, so the shards can also be read with any tar reader. Next to the shards an index is written with the offset
+# of the WAV data of every sample in its shard, which is used for random access.
+class ShardWriter:
+    def __init__(self, directory, prefix, shard_size=SHARD_SIZE):
+        self.directory = directory
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.shards = 0
+        self.samples = 0
+        self.tar = None
+        self.shard_path = None
+        self.index_path = path.join(directory, index_name(prefix))
+        self.index_file = open(self.index_path + ".part", "w", newline="", encoding="utf-8")
+        self.index = csv.writer(self.index_file)
+        self.index.writerow(Sample._fields)
+
+    # Start a new shard, we write to a temporary file first and rename it once the shard is full
+    def next_shard(self):
+        self.close_shard()
+        self.shard_path = path.join(self.directory, self.prefix + "-" + str(self.shards).zfill(6) + ".tar")
+        self.tar = tarfile.open(self.shard_path + ".part", "w", format=tarfile.USTAR_FORMAT)
+        self.shards += 1
+
+    def close_shard(self):
+        if self.tar is not None:
+            self.tar.close()
+            os.replace(self.shard_path + ".part", self.shard_path)
+            self.tar = None
+
+    # Add a sample, given the bytes of its WAV file and its transcript
+    def add(self, wav_bytes, transcript):
+        if self.tar is None or self.tar.offset >= self.shard_size:
+            self.next_shard()
+
+        key = str(self.samples).zfill(9)
+        with metrics.timer("shard_write"):
+            offset = self.add_member(key + ".wav", wav_bytes)
+            self.add_member(key + ".txt", transcript.encode("utf-8"))
+        self.index.writerow(Sample(key, path.basename(self.shard_path), offset, len(wav_bytes),
+                                   transcript))
+        self.samples += 1
+
+    # Add one file to the current shard and return the offset of its data. In the USTAR format the data always comes
+    # right after a single header block.
+    def add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        offset = self.tar.offset + tarfile.BLOCKSIZE
+        self.tar.addfile(info, io.BytesIO(data))
+        return offset
+
+    # Close the last shard and the index. The index is renamed last, so it only exists when all the shards are complete.
+    def close(self):
+        self.close_shard()
+        self.index_file.close()
+        os.replace(self.index_path + ".part", self.index_path)
+
+
+# This class reads the samples in the shards of an index, either one by one in order (iterating over it) or at random
+# (indexing it). The index is kept in memory, the audio is only read when a sample is asked for.
+class ShardReader:
+    def __init__(self, index_path):
+        self.directory = path.dirname(index_path)
+        with open(index_path, newline="", encoding="utf-8") as f:
+            reader = csv.reader(f)
+            next(reader)  # Skip the header
+            self.samples = [Sample(key, shard, int(offset), int(size), transcript)
+                            for key, shard, offset, size, transcript in reader]
+        self.open_files = {}
+
+    def __len__(self):
+        return len(self.samples)
+
+    # Random access: returns the samples, the sample rate and the transcript of the i-th sample
+    def __getitem__(self, i):
+        sample = self.samples[i]
+        shard = self.open_files.get(sample.shard)
+        if shard is None:
+            shard = open(path.join(self.directory, sample.shard), "rb")
+            self.open_files[sample.shard] = shard
+        shard.seek(sample.offset)
+        return decode(shard.read(sample.size), sample.transcript)
+
+    # Sequential access: every shard is opened once and read from the front to the back
+    def __iter__(self):
+        shard = None
+        try:
+            for sample in self.samples:
+                if shard is None or shard.name != path.join(self.directory, sample.shard):
+                    if shard is not None:
+                        shard.close()
+                    shard = open(path.join(self.directory, sample.shard), "rb")
+                shard.seek(sample.offset)
+                yield decode(shard.read(sample.size), sample.transcript)
+        finally:
+            if shard is not None:
+                shard.close()
+
+    def close(self):
+        for shard in self.open_files.values():
+            shard.close()
+        self.open_files = {}
+
+
+# This function decodes the WAV data of a sample
+def decode(wav_bytes, transcript):
+    data, samplerate = sf.read(io.BytesIO(wav_bytes), dtype="float32")
+    return data, samplerate, transcript
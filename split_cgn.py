@@ -1,171 +1,561 @@
-import sys
 import os
 from os import path
-import gzip
-import xml.etree.ElementTree as ET
-from pydub import AudioSegment
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import annotation
+import audio
+import corpus_index
+import corpus_catalog
+import metrics
+import manifest
+import stages
+import sharding
+import segment_cache
+import validation
 
 
 ERROR_FILE = "failed_files.txt"
+JOURNAL_FILE = "split_journal.txt"  # Every recording that has been split completely, one per line
 DURATION = 4
 
 WIDTH = 3  # The amount of padding we use. This padding is necessary for sorting in the import phase.
 
+PROGRESS_EVERY = 100  # Print the progress every time this many recordings have been split
+
+
+# The definition that gets called with the arguments from main. A catalog that was already scanned can be given, and
+# the recordings that failed are returned.
+def split_files(args, catalog=None):
+    target = args.target
+    index_file = None if args.no_index else args.index
+
+    # Every shard writes to its own manifest, journal and error file
+    manifest_file = None if args.manifest is None else sharding.shard_file(args.manifest, args.shard)
+    journal_file = sharding.shard_file(args.journal, args.shard)
+    error_file = sharding.shard_file(ERROR_FILE, args.shard)
+    report_file = None if args.no_validate else sharding.shard_file(args.report, args.shard)
+    target_format = audio.AudioFormat(args.samplerate, args.channels, args.sample_width)
 
-# The definition that gets called with the target from main
-def split_files(target):
     # Check to see if we get a correct path
     if not path.isdir(target):
-        print("Could not locate the target")
+        metrics.log("Could not locate the target")
     else:
-        print("Found top level directory in: ", target)
-
-    print("Locating the sound files and corresponding annotations")
-
-    # Go to the audio and transcription directories
-    audio_path = path.join(target, "data/audio/wav")
-    trans_path = path.join(target, "data/annot/xml/skp-ort")
-
-    # Check every file/directory at the given path
-    for x in os.listdir(audio_path):
-        new_audio_path = path.join(audio_path, x)
-        # If we find a correct directory we need to enter
-        if os.path.isdir(new_audio_path) and x.startswith("comp"):
-            new_trans_path = path.join(trans_path, x)
-            print("---------------------------------------------------------")
-            print("Entering directory " + x)
-            process_component(new_audio_path, new_trans_path)
-            print("---------------------------------------------------------")
-
-
-# This definition will process one component at a time at the given paths.
-def process_component(audio_path, trans_path):
-    # Loop over every directory (= language)
-    for directory in os.listdir(audio_path):
-        print("Processing files for language: " + directory)
-        audio_dir = path.join(audio_path, directory)
-        trans_dir = path.join(trans_path, directory)
-        for file in os.listdir(audio_dir):
-            split_file(audio_dir, trans_dir, file)
-        print("Finished processing language: " + directory)
-
-
-def split_file(audio_dir, trans_dir, filename):
-    # The current filename ends with .wav but we need it to be .skp
-    name = filename.split(".")[0]
-    filename = name + ".skp"
-    trans_path = path.join(trans_dir, filename)
-
-    # If the file does not exist, it means that it has not been extracted
-    if not path.exists(trans_path):
-        zipped_file = filename + ".gz"
-        trans_path = path.join(trans_dir, zipped_file)
-        # We open the zipped file and parse the tree from it
-        with gzip.open(trans_path) as trans_file:
-            tree = ET.parse(trans_file)
-
-    # Otherwise the file is extracted and we can just parse instantly
+        metrics.log("Found top level directory in: " + target)
+
+    metrics.log("Locating the sound files and corresponding annotations")
+
+    # Find all the recordings and their annotations at once, the ones without an annotation can not be split
+    if catalog is None:
+        catalog = corpus_catalog.get_catalog(target, args.catalog)
+    catalog = sharding.select(catalog, args.shard)
+    catalog.report()
+    orphans = [r for r in catalog.orphan_recordings() if "(" not in r.name]
+    append_errors(error_file, [(recording.audio_path, "no annotation") for recording in orphans])
+
+    # All the recordings that have to be split
+    cache_dir = None if args.cache is None or manifest_file is not None else args.cache
+    tasks = collect_tasks(catalog, index_file, manifest_file is not None, target_format, cache_dir)
+
+    # Skip the recordings that were already split by a previous run, otherwise start a new journal
+    if args.resume and path.exists(journal_file):
+        finished = read_journal(journal_file)
+        tasks = [task for task in tasks if path.join(task[0], task[2]) not in finished]
+        metrics.log("Resuming: skipping " + str(len(finished)) + " recordings that were already split")
+        if manifest_file is not None:
+            resume_manifest(manifest_file, finished)
     else:
-        trans_path = path.join(trans_dir, filename)
-        trans_file = open(trans_path, "r")
-        tree = ET.parse(trans_file)
-
-    root = tree.getroot()
-
-    i = 0  # A counter
-    xml_string = ""  # We construct the XML string, two sentences at a time
+        open(journal_file, "w").close()
+        if manifest_file is not None:
+            manifest.create_manifest(manifest_file)
+
+    # Check the headers of the recordings that are left before anything is split. The ones that can not be decoded are
+    # skipped, without reading more than their header.
+    if report_file is not None:
+        remaining = set(path.join(task[0], task[2]) for task in tasks)
+        recordings = [r for r in catalog.originals() if r.audio_path in remaining]
+        results = validation.validate(recordings, args.validate_threads, index_file)
+        validation.print_summary(results)
+        validation.write_report(report_file, results)
+        metrics.log("Written the report of the headers to " + report_file)
+        invalid = {result.path: result.reason for result in results if result.reason}
+        if invalid:
+            tasks = [task for task in tasks if path.join(task[0], task[2]) not in invalid]
+            append_errors(error_file, invalid.items())
+
+    metrics.log("---------------------------------------------------------")
+    metrics.log("Splitting " + str(len(tasks)) + " recordings using " + str(args.workers) + " worker(s)")
+    if manifest_file is not None:
+        metrics.log("Only writing the segments to " + manifest_file + ", the recordings are not cut")
+    if args.pipeline:
+        metrics.log("Using a pipeline with " + str(args.pipeline) + " thread(s) per stage")
+    failed = run_tasks(tasks, args.workers, journal_file, manifest_file, args.pipeline, error_file)
+    metrics.log("---------------------------------------------------------")
+
+    # The checksums let merge_shards.py check that the files of a shard are complete. Every shard has an error file,
+    # even when nothing failed.
+    if args.shard is not None:
+        open(error_file, "a").close()
+        for filename in (manifest_file, journal_file, error_file, report_file):
+            if filename is not None:
+                sharding.write_checksum(filename)
+
+    # Keep the segment cache within its size, the segments that were not used for the longest time go first
+    if cache_dir is not None:
+        removed = segment_cache.evict(cache_dir, args.cache_size * 1024 * 1024)
+        metrics.log("Removed " + str(removed) + " segments from the cache in " + cache_dir)
+
+    # Only once every recording has been split, we can remove the original files to save space. The segments of a
+    # manifest still point into the original files, so those are never removed.
+    if args.delete_sources:
+        if manifest_file is not None:
+            metrics.log("Not removing the original files because the manifest points into them")
+        elif failed:
+            metrics.log("Not removing the original files because some recordings failed, run again with --resume")
+        else:
+            remove_sources(journal_file)
+
+    return failed
+
+
+# This definition collects the original recordings in the catalog that have an annotation (segments of an earlier run
+# are skipped). A task holds the directories of the recording, its file name and the path of its annotation. The stat
+# results of the catalog go along, so the files are not looked up again.
+def collect_tasks(catalog, index_file=None, virtual=False, target_format=None, cache_dir=None):
+    tasks = []
+    for recording in catalog.originals():
+        tasks.append((path.dirname(recording.audio_path), path.dirname(recording.trans_path),
+                      path.basename(recording.audio_path), recording.trans_path, index_file, virtual, target_format,
+                      cache_dir, recording.audio_stat, recording.trans_stat))
+    return tasks
+
+
+# This definition splits all the given recordings, either one at a time or fanned out over a pool of processes.
+# The failures (and the segments in the virtual mode) are collected here so that only the main process writes to the
+# error file, the journal and the manifest. It returns the recordings that failed.
+# With a pipeline (the number of threads per stage) the recordings go through the stages of run_pipeline instead.
+def run_tasks(tasks, workers, journal_file, manifest_file=None, pipeline=0, error_file=ERROR_FILE):
+    start = time.time()
+    done = 0
+    segments = 0
+    failed = []
+    journal = open(journal_file, "a")
+
+    executor = None
+    if pipeline:
+        # The threads of the pipeline count in the metrics of this process, there is nothing to merge
+        results = ((result, None) for result in run_pipeline(tasks, pipeline))
+    elif workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=metrics.configure,
+                                       initargs=(metrics.settings["quiet"], metrics.settings["verbose"]))
+        results = executor.map(split_task, tasks)
+    else:
+        results = map(split_task, tasks)
+
+    for (audio_path, trans_path, new_segments, error), task_metrics in results:
+        done += 1
+        if task_metrics is not None:
+            metrics.merge(task_metrics)
+        if error is not None:
+            metrics.detail("Failed: " + audio_path + " (" + error + ")")
+            metrics.count("recordings_failed")
+            failed.append((audio_path, error))
+            continue
+
+        if manifest_file is not None:
+            manifest.write_segments(manifest_file, new_segments)
+            new_segments = len(new_segments)
+        segments += new_segments
+        metrics.count("recordings_split")
+        metrics.count("segments", new_segments)
+        metrics.detail("Split " + audio_path + " into " + str(new_segments) + " segments")
+
+        # The recording is only marked as finished once all of its segments are on disk
+        journal.write(audio_path + "\t" + trans_path + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+
+        if done % PROGRESS_EVERY == 0:
+            metrics.log("Split " + str(done) + "/" + str(len(tasks)) + " recordings")
+
+    if executor is not None:
+        executor.shutdown()
+    journal.close()
+
+    # Write all the failures at once, one recording per line together with the reason
+    append_errors(error_file, failed)
+
+    elapsed = time.time() - start
+    metrics.log("Split " + str(done - len(failed)) + " recordings into " + str(segments) + " segments")
+    metrics.log("Failed recordings: " + str(len(failed)) + " (see " + error_file + ")")
+    metrics.log("Elapsed time: %.1f seconds (%.2f recordings/s, %.2f segments/s)"
+          % (elapsed, done / max(elapsed, 1e-9), segments / max(elapsed, 1e-9)))
+
+    return failed
+
+
+# This definition keeps the segments of the finished recordings in the manifest of a resumed run. The segments of a
+# recording that was not marked as finished are written again when it is split again.
+def resume_manifest(manifest_file, finished):
+    if not path.exists(manifest_file):
+        manifest.create_manifest(manifest_file)
+        return
+    removed = manifest.keep_segments(manifest_file, finished)
+    if removed:
+        metrics.log("Removed " + str(removed) + " segments of unfinished recordings from " + manifest_file)
+
+
+# This definition adds the given recordings to the error file, one per line together with the reason. A run with
+# --resume sees the same recordings again, so the lines that are already in the file are not added twice.
+def append_errors(error_file, errors):
+    lines = [audio_path + "\t" + reason + "\n" for audio_path, reason in errors]
+    if not lines:
+        return
+    written = set()
+    if path.exists(error_file):
+        with open(error_file) as f:
+            written = set(f)
+    with open(error_file, "a") as f:
+        for line in lines:
+            if line not in written:
+                f.write(line)
+                written.add(line)
+
+
+# This definition reads the recordings in the journal, together with their annotations
+def read_journal(journal_file):
+    finished = {}
+    with open(journal_file) as journal:
+        for line in journal:
+            if line.endswith("\n"):  # A line that was cut off by a crash does not count
+                audio_path, trans_path = line[:-1].split("\t")
+                finished[audio_path] = trans_path
+    return finished
+
+
+# This definition removes the original files of all the recordings in the journal
+def remove_sources(journal_file):
+    finished = read_journal(journal_file)
+    metrics.log("Removing the original files of " + str(len(finished)) + " recordings")
+    for audio_path, trans_path in finished.items():
+        if os.path.exists(trans_path):
+            os.remove(trans_path)
+        if os.path.exists(audio_path):
+            os.remove(audio_path)
+
+
+# This definition splits one recording, together with the metrics of only this recording.
+def split_task(task):
+    return metrics.collect(split_recording, task)
+
+
+# This definition splits one recording and never raises, so one bad recording does not bring down the pool.
+# It returns the paths of the recording and its annotation, the number of segments (or the segments themselves in the
+# virtual mode) and the reason it failed (or None).
+def split_recording(task):
+    (audio_dir, trans_dir, filename, trans_path, index_file, virtual, target_format, cache_dir, audio_stat,
+     trans_stat) = task
+    audio_path = path.join(audio_dir, filename)
+    try:
+        # Every process opens its own connection to the index
+        index = None if index_file is None else corpus_index.open_index(index_file)
+        if virtual:
+            return audio_path, trans_path, segment_file(audio_path, trans_path, index, audio_stat, trans_stat), None
+        segments = split_file(audio_dir, trans_dir, filename, trans_path, index, target_format, cache_dir,
+                              audio_stat, trans_stat)
+        return audio_path, trans_path, segments, None
+    except Exception as e:
+        return audio_path, trans_path, 0, type(e).__name__ + ": " + str(e)
+
+
+# This generator groups the "tau" segments (more or less equal to a sentence each) until the group lasts at least
+# DURATION seconds. It yields the begin and end of every group together with its "tau" segments.
+def group_taus(taus):
+    group = []
     begin = 0
     end = 0
 
-    # A quick check to see if the file can actually be split up, because some of the files use a non-compatible codec
-    audio_name = name + ".wav"
-    audio_path = path.join(audio_dir, audio_name)
-    try:
-        AudioSegment.from_wav(audio_path)
-    except:
-        with open(ERROR_FILE, "a") as error_file:
-            error_file.write(audio_path)
-        return 0
-
-    # This for loop will iterate over all the "tau" segments (more or less equal to a sentence each)
-    for tau in root.iter("tau"):
-        seg_begin = float(tau.get("tb"))  # The begin of the segment
-        seg_end = float(tau.get("te"))
-
+    for tau in taus:
         # If we start at a new segment we have to reset the beginning. Once finished with a segment we set end back to 0
         if end == 0:
-            begin = seg_begin
+            begin = tau.tb
 
         # Set a new end and calculate the duration
-        end = seg_end
+        end = tau.te
         duration = end - begin
 
-        # Append the xml string
-        xml_string = xml_string + ET.tostring(tau).decode("utf-8")  # Apparently tostring does not return a string...
+        group.append(tau)
 
         # If the duration is long enough we will split it up
         if duration >= DURATION:
-            # Construct a new file with the given counter
-            new_file = name + "(" + str(i).zfill(WIDTH) + ")" + ".skp"
-            new_trans_path = path.join(trans_dir, new_file)
-            f = open(new_trans_path, "w+")
-
-            # Write the file
-            xml_string = "<transcription>" + xml_string + "</transcription>"
-            f.write(xml_string)
+            yield begin, end, group
 
-            # Split the audio file at the given timestamps
-            split_audio(audio_dir, name, i, begin, end)
-
-            # Reset the end and the xml_string
-            xml_string = ""
+            # Reset the end and the segments
+            group = []
             end = 0
-            i += 1  # update the counter
 
     # Check if we still have a left over sentence after iterating over them
-    if xml_string != "":
-        # Construct a new file with the given counter
-        new_file = name + "(" + str(i).zfill(WIDTH) + ")" + ".skp"
-        new_trans_path = path.join(trans_dir, new_file)
-        f = open(new_trans_path, "w+")
-
-        # Write the file
-        xml_string = "<transcription>" + xml_string + "</transcription>"
-        f.write(xml_string)
-
-        # Split the audio file at the given timestamps
-        split_audio(audio_dir, name, i, begin, end)
-
-    # Remove the original files to save space
-    if os.path.exists(trans_path):
-        os.remove(trans_path)
-    audio_name = name + ".wav"
-    audio_path = path.join(audio_dir, audio_name)
-    if os.path.exists(audio_path):
-        os.remove(audio_path)
+    if group:
+        yield begin, end, group
 
 
-# This definition will split an audio file and save it under a new name
-def split_audio(audio_dir, name, i, begin, end):
-    # Get the original file and make it into an AudioSegment
-    original_name = name + ".wav"
-    audio_path = path.join(audio_dir, original_name)
-    audio_file = AudioSegment.from_wav(audio_path)
+# With a cache, the segments that were cut before (the same span of the same recording in the same format) are linked
+# from the cache instead of being cut again.
+def split_file(audio_dir, trans_dir, filename, trans_path, index=None, target_format=None, cache_dir=None,
+               audio_stat=None, trans_stat=None):
+    name = filename.split(".")[0]
 
-    # Construct the new fragment
-    begin = begin * 1000  # The module uses milliseconds
-    end = end * 1000
-    new_fragment = audio_file[begin:end]
+    i = 0  # A counter
 
-    # Save the new file
+    # Open the recording once. Only the header is read here, which is enough to see if the file can actually be
+    # split up, because some of the files use a non-compatible codec. If it can't, the error ends up in the error file.
+    audio_name = name + ".wav"
+    audio_path = path.join(audio_dir, audio_name)
+    audio_file = audio.open_audio(audio_path)
+    source = None if cache_dir is None else corpus_index.source_hash(audio_path, index, audio_stat)
+
+    for begin, end, taus in group_taus(corpus_index.read_taus(trans_path, index, True, trans_stat)):
+        # Write the transcription and split the audio file at the given timestamps
+        new_trans_path = split_transcription(trans_dir, name, i, taus)
+        info = None
+        if cache_dir is None:
+            new_audio_path, info = split_audio(audio_file, audio_dir, name, i, begin, end, target_format)
+        else:
+            key = segment_cache.segment_key(source, begin, end, target_format)
+            cached = segment_cache.lookup(cache_dir, key)
+            if cached is not None:
+                new_audio_path = segment_path(audio_dir, name, i)
+                segment_cache.fetch(cached, new_audio_path)
+            else:
+                new_audio_path, info = split_audio(audio_file, audio_dir, name, i, begin, end, target_format)
+                segment_cache.store(cache_dir, key, new_audio_path)
+        index_segment(index, new_audio_path, info, new_trans_path, taus)
+        i += 1  # update the counter
+
+    audio_file.close()
+    remove_segments(audio_dir, trans_dir, name, i)
+
+    # Return the number of segments
+    return i
+
+
+# This definition only calculates the segments of one recording, without cutting it or removing anything.
+# It returns the segments for the manifest.
+def segment_file(audio_path, trans_path, index=None, audio_stat=None, trans_stat=None):
+    info = corpus_index.probe_wav(audio_path, audio_stat, index)
+    return make_segments(audio_path, info, corpus_index.read_taus(trans_path, index, stat=trans_stat))
+
+
+# This definition turns the "tau" segments of a recording into the segments for the manifest
+def make_segments(audio_path, info, recording_taus):
+    segments = []
+    for begin, end, taus in group_taus(recording_taus):
+        start_frame = audio.to_frame(info, begin)
+        num_frames = max(audio.to_frame(info, end) - start_frame, 0)
+
+        # Like the importer, we do not want a transcript when the "tau" segments overlap
+        transcript = "" if annotation.is_overlapping(taus) else " ".join(w for tau in taus for w in tau.words)
+        speaker = annotation.main_speaker(taus) or ""
+        segments.append(manifest.Segment(audio_path, start_frame, num_frames, transcript, speaker))
+
+    return segments
+
+
+# This definition will write the given "tau" segments to a new annotation file
+def split_transcription(trans_dir, name, i, taus):
+    new_trans_path = segment_trans_path(trans_dir, name, i)
+    annotation.write_taus(new_trans_path, taus)
+    return new_trans_path
+
+
+# This definition will cut a segment out of the opened audio file and save it under a new name, in the target format.
+# It returns the path and the header information of the new segment.
+def split_audio(audio_file, audio_dir, name, i, begin, end, target_format=None):
+    # Only read the frames of the new fragment from the original file, it is converted right away
+    new_fragment, samplerate, subtype = audio.read_segment(audio_file, begin, end, target_format)
+
+    new_audio_path = write_audio(audio_dir, name, i, new_fragment, samplerate, subtype)
+    return new_audio_path, audio.segment_info(new_fragment, samplerate, subtype)
+
+
+# This definition saves a segment under its new name and returns its path
+def write_audio(audio_dir, name, i, data, samplerate, subtype):
+    new_audio_path = segment_path(audio_dir, name, i)
+    audio.write_segment(new_audio_path, data, samplerate, subtype)
+    return new_audio_path
+
+
+# This definition adds the "tau" segments and the header (when it is known) of a new segment to the index, so
+# import_cgn.py does not have to read the files split_cgn.py just wrote
+def index_segment(index, audio_path, info, trans_path, taus):
+    if index is None:
+        return
+    corpus_index.store_taus(trans_path, os.stat(trans_path), taus, index)
+    if info is not None:
+        corpus_index.store_wav(audio_path, os.stat(audio_path), info, index)
+
+
+# This definition returns the path of the i-th segment of a recording
+def segment_path(audio_dir, name, i):
     new_name = name + "(" + str(i).zfill(WIDTH) + ")" + ".wav"  # Use zfill to pad the index so we get 000 001 etc.
-    new_audio_path = path.join(audio_dir, new_name)
-    new_fragment.export(new_audio_path, format="wav")
+    return path.join(audio_dir, new_name)
+
+
+# This definition returns the path of the annotation of the i-th segment of a recording
+def segment_trans_path(trans_dir, name, i):
+    return path.join(trans_dir, name + "(" + str(i).zfill(WIDTH) + ")" + ".skp")
+
+
+# This definition removes the segments of a recording from number first on. They are left behind by an earlier split
+# into more segments (with a shorter DURATION), and would otherwise be imported together with the new ones. The segments
+# are numbered without gaps, so we stop at the first one that does not exist.
+def remove_segments(audio_dir, trans_dir, name, first):
+    i = first
+    while True:
+        paths = (segment_path(audio_dir, name, i), segment_trans_path(trans_dir, name, i))
+        stale = [p for p in paths if path.exists(p)]
+        if not stale:
+            return
+        for stale_path in stale:
+            os.remove(stale_path)
+        metrics.count("stale_segments")
+        i += 1
+
+
+# This definition splits the recordings in a pipeline of three stages, each with the given number of threads: reading
+# (the annotation is decompressed and the audio decoded), cutting (the annotation is parsed, the segments are cut and
+# converted in memory) and writing. The stages overlap, so the disk and the CPU are busy at the same time.
+# Every recording in the pipeline is decoded completely, so only one more than the threads of a stage are let in at
+# once instead of stages.QUEUE_SIZE: that keeps every stage busy while memory stays bounded by a few recordings.
+# It yields the same results as split_task, in the order of the tasks.
+def run_pipeline(tasks, threads):
+    results = stages.run_stages(tasks, [(read_recording, threads), (cut_recording, threads),
+                                        (write_recording, threads)], queue_size=min(threads + 1, stages.QUEUE_SIZE),
+                                catch=True)
+    for task, result in zip(tasks, results):
+        if isinstance(result, stages.Failed):
+            audio_dir, trans_dir, filename, trans_path = task[:4]
+            error = type(result.error).__name__ + ": " + str(result.error)
+            result = (path.join(audio_dir, filename), trans_path, 0, error)
+        yield result
+
+
+# The reader stage: loads the annotation and decodes the recording (only its header in the virtual mode). With a cache
+# the recording is only decoded in the next stage, when a segment is not in the cache.
+def read_recording(task):
+    (audio_dir, trans_dir, filename, trans_path, index_file, virtual, target_format, cache_dir, audio_stat,
+     trans_stat) = task
+    index = None if index_file is None else corpus_index.open_index(index_file)
+    audio_path = path.join(audio_dir, filename)
+    loaded = corpus_index.load_annotation(trans_path, index, not virtual, trans_stat)
+    if virtual:
+        recording = corpus_index.probe_wav(audio_path, audio_stat, index)
+    elif cache_dir is not None:
+        recording = None
+    else:
+        recording = audio.decode_all(audio_path)
+    return task, loaded, recording
+
+
+# The compute stage: parses the annotation and cuts the decoded recording into (converted) segments. A piece is the
+# "tau" segments of a segment, its key in the cache, its file in the cache (or None) and the cut audio (or None).
+def cut_recording(item):
+    task, loaded, recording = item
+    audio_dir, trans_dir, filename, _, index_file, virtual, target_format, cache_dir, audio_stat, _ = task
+    index = None if index_file is None else corpus_index.open_index(index_file)
+    taus = corpus_index.parse_annotation(loaded, index, keep_xml=not virtual)
+    if virtual:
+        return task, loaded.path, make_segments(path.join(audio_dir, filename), recording, taus)
+
+    source = None if cache_dir is None else corpus_index.source_hash(path.join(audio_dir, filename), index, audio_stat)
+    pieces = []
+    for begin, end, group in group_taus(taus):
+        key = cached = None
+        if cache_dir is not None:
+            key = segment_cache.segment_key(source, begin, end, target_format)
+            cached = segment_cache.lookup(cache_dir, key)
+            if cached is not None:
+                pieces.append((group, key, cached, None))
+                continue
+            if recording is None:
+                recording = audio.decode_all(path.join(audio_dir, filename))
+        pieces.append((group, key, None, audio.cut_segment(recording, begin, end, target_format)))
+    return task, loaded.path, pieces
+
+
+# The writer stage: writes the annotation and the audio of every segment
+def write_recording(item):
+    task, trans_path, pieces = item
+    audio_dir, trans_dir, filename, _, index_file, virtual, target_format, cache_dir, _, _ = task
+    audio_path = path.join(audio_dir, filename)
+    if virtual:
+        return audio_path, trans_path, pieces, None
+
+    name = filename.split(".")[0]
+    index = None if index_file is None else corpus_index.open_index(index_file)
+    for i, (taus, key, cached, converted) in enumerate(pieces):
+        new_trans_path = split_transcription(trans_dir, name, i, taus)
+        if cached is not None:
+            new_audio_path = segment_path(audio_dir, name, i)
+            segment_cache.fetch(cached, new_audio_path)
+            index_segment(index, new_audio_path, None, new_trans_path, taus)
+            continue
+        new_audio_path = write_audio(audio_dir, name, i, *converted)
+        if key is not None:
+            segment_cache.store(cache_dir, key, new_audio_path)
+        index_segment(index, new_audio_path, audio.segment_info(*converted), new_trans_path, taus)
+    remove_segments(audio_dir, trans_dir, name, len(pieces))
+    return audio_path, trans_path, len(pieces), None
+
+
+# This function builds the parser for the command line arguments, preprocess.py uses it for the defaults as well
+def get_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="the top level target directory")
+    parser.add_argument("--workers", type=int, default=1, help="the number of processes splitting recordings in parallel")
+    parser.add_argument("--manifest", help="only write the segments to this CSV file instead of cutting the recordings")
+    parser.add_argument("--journal", default=JOURNAL_FILE, help="the file in which the finished recordings are kept")
+    parser.add_argument("--resume", action="store_true", help="skip the recordings that are already in the journal")
+    parser.add_argument("--delete-sources", action="store_true",
+                        help="remove the original files once every recording has been split")
+    parser.add_argument("--index", default=corpus_index.INDEX_FILE, help="the file with the cached annotation index")
+    parser.add_argument("--no-index", action="store_true", help="always parse the annotations, without using the index")
+    parser.add_argument("--samplerate", type=int, help="resample the segments to this sample rate")
+    parser.add_argument("--channels", type=int, help="mix the segments down (or up) to this number of channels")
+    parser.add_argument("--sample-width", type=int, choices=sorted(audio.SUBTYPES),
+                        help="write the segments with this many bytes per sample")
+    parser.add_argument("--catalog", help="use the catalog saved in this file instead of scanning the target")
+    parser.add_argument("--pipeline", type=int, default=0, metavar="THREADS",
+                        help="read, cut and write the recordings in overlapping stages with this many threads each")
+    parser.add_argument("--cache", nargs="?", const=segment_cache.CACHE_DIR, metavar="DIR",
+                        help="keep the segments in this cache and link the ones that were cut before instead of cutting "
+                             "them again (default directory: " + segment_cache.CACHE_DIR + ")")
+    parser.add_argument("--cache-size", type=int, default=segment_cache.CACHE_SIZE, metavar="MB",
+                        help="remove the least recently used segments once the cache is larger than this")
+    parser.add_argument("--report", default=validation.REPORT_FILE,
+                        help="the CSV file with the codec, sample rate and channels of every recording")
+    parser.add_argument("--validate-threads", type=int, default=validation.THREADS,
+                        help="the number of threads reading the headers of the recordings before they are split")
+    parser.add_argument("--no-validate", action="store_true", help="do not check the headers before splitting")
+    parser.add_argument("--shard", type=sharding.parse_shard, metavar="i/N",
+                        help="only split the recordings in the i-th of N shards, with a manifest and journal per shard")
+    parser.add_argument("--quiet", action="store_true", help="only print the results")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every file")
+    parser.add_argument("--metrics", help="write the counters and timers to this JSON file")
+    return parser
 
 
 if __name__ == "__main__":
-    print("Starting the splitting of the data")
+    # Starting the parser for the command line arguments
+    parser = get_parser()
+    args = parser.parse_args()
+    if args.manifest is not None and args.delete_sources:
+        parser.error("--delete-sources can not be used with --manifest, the manifest points into the original files")
+
+    metrics.configure(args.quiet, args.verbose)
+    metrics.log("Starting the splitting of the data")
 
-    split_files(sys.argv[1])
+    split_files(args)
 
-    print("Completed successfully")
+    metrics.summarize(args.metrics)
+    metrics.log("Completed successfully")
@@ -0,0 +1,78 @@
+import threading
+import queue
+from collections import namedtuple
+
+# The number of items that may be on their way through the stages at the same time. When the last stage can not keep
+# up, the first stage waits, so memory is bounded by this many items.
+QUEUE_SIZE = 8
+
+# An exception raised by a stage for one item, passed on to the end instead of the result of the item
+Failed = namedtuple("Failed", ["error"])
+
+# Put in a queue after the last item
+_DONE = object()
+
+
+# This generator runs every item through the given stages and yields the results in the order of the items.
+# A stage is a function and the number of threads running it. The stages are connected by bounded queues, so a stage
+# starts on the next item as soon as it passed the previous one on: while one thread waits for the disk, another one
+# parses or writes. The throughput is that of the slowest stage instead of the sum of all the stages.
+# Exceptions are raised here, or yielded as a Failed result when catch is set, so one bad item does not stop the others.
+def run_stages(items, stages, queue_size=QUEUE_SIZE, catch=False):
+    queues = [queue.Queue(queue_size) for _ in range(len(stages) + 1)]
+    in_flight = threading.Semaphore(queue_size)
+
+    def feed():
+        for n, item in enumerate(items):
+            in_flight.acquire()
+            queues[0].put((n, item))
+        queues[0].put(_DONE)
+
+    def work(function, source, sink):
+        while True:
+            entry = source.get()
+            if entry is _DONE:
+                source.put(_DONE)  # Let the other threads of this stage see it as well
+                return
+            n, item = entry
+            if not isinstance(item, Failed):
+                try:
+                    item = function(item)
+                except Exception as e:
+                    item = Failed(e)
+            sink.put((n, item))
+
+    # Once every thread of a stage is done, the next stage gets told that no more items will come
+    def close(threads, sink):
+        for thread in threads:
+            thread.join()
+        sink.put(_DONE)
+
+    start(feed)
+    for (function, workers), source, sink in zip(stages, queues, queues[1:]):
+        threads = [start(work, function, source, sink) for _ in range(max(workers, 1))]
+        start(close, threads, sink)
+
+    # The results of the threads come in any order, they are kept until all the items before them are there
+    waiting = {}
+    next_n = 0
+    while True:
+        entry = queues[-1].get()
+        if entry is _DONE:
+            break
+        n, result = entry
+        waiting[n] = result
+        while next_n in waiting:
+            result = waiting.pop(next_n)
+            next_n += 1
+            in_flight.release()
+            if isinstance(result, Failed) and not catch:
+                raise result.error
+            yield result
+
+
+# This function starts a daemon thread, so a run that stops halfway never keeps the process alive
+def start(function, *args):
+    thread = threading.Thread(target=function, args=args, daemon=True)
+    thread.start()
+    return thread
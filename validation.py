@@ -0,0 +1,101 @@
+import os
+import argparse
+import csv
+from collections import namedtuple, Counter
+from concurrent.futures import ThreadPoolExecutor
+import corpus_index
+import corpus_catalog
+import metrics
+
+# The default file the report is written to
+REPORT_FILE = "wav_report.csv"
+
+THREADS = 8  # Reading a header is mostly waiting on the disk, so threads are enough
+
+# The codecs (WAV format tags) the recordings can be decoded from, and the sample sizes of plain PCM
+CODECS = {1: "pcm", 3: "float", 6: "alaw", 7: "mulaw", 0xFFFE: "extensible"}
+PCM_BITS = (8, 16, 24, 32)
+
+# The outcome of the check of one recording. The reason is empty when the recording can be split.
+Result = namedtuple("Result", ["path", "codec", "samplerate", "channels", "reason"])
+
+
+# This function checks the recordings in a pool of threads, from their headers only. The results are in the order of
+# the recordings, they are printed here so the lines of the threads do not get mixed up.
+def validate(recordings, threads=THREADS, index_file=None):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda r: check_recording(r, index_file), recordings))
+
+    for result in results:
+        if result.reason:
+            metrics.count("invalid_recordings")
+            metrics.detail("Invalid: " + result.path + " (" + result.reason + ")")
+    return results
+
+
+# This function checks one recording of the catalog, every thread opens its own connection to the index
+def check_recording(recording, index_file=None):
+    index = None if index_file is None else corpus_index.open_index(index_file)
+    return check_wav(recording.audio_path, recording.audio_stat, index)
+
+
+# This function checks if a WAV file can be decoded, by reading its header only
+def check_wav(audio_path, stat=None, index=None):
+    try:
+        info = corpus_index.probe_wav(audio_path, stat, index)
+    except Exception as e:
+        return Result(audio_path, "", "", "", "unreadable header (" + type(e).__name__ + ": " + str(e) + ")")
+
+    # Files that are not RIFF/WAVE are probed by soundfile, which could open them, so they have no format tag
+    codec = "other" if info.format_tag is None else CODECS.get(info.format_tag, "unknown (" + str(info.format_tag) + ")")
+    reason = ""
+    if info.format_tag is not None and info.format_tag not in CODECS:
+        reason = "unsupported codec"
+    elif info.format_tag == 1 and info.bits_per_sample not in PCM_BITS:
+        reason = "unsupported sample size (" + str(info.bits_per_sample) + " bits)"
+    elif not info.samplerate:
+        reason = "no sample rate"
+    elif not info.channels:
+        reason = "no channels"
+    elif not info.frames:
+        reason = "no audio"
+    return Result(audio_path, codec, info.samplerate, info.channels, reason)
+
+
+# This function writes the results to a CSV file, one row for every recording
+def write_report(report_file, results):
+    temp_file = report_file + ".part"
+    with open(temp_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(Result._fields)
+        writer.writerows(results)
+    os.replace(temp_file, report_file)
+
+
+# This function prints how many recordings are invalid, per reason
+def print_summary(results):
+    reasons = Counter(result.reason.split(" (")[0] for result in results if result.reason)
+    metrics.log("Checked the headers of " + str(len(results)) + " recordings, " + str(sum(reasons.values()))
+                + " can not be split")
+    for reason, amount in sorted(reasons.items()):
+        metrics.log("  " + reason + ": " + str(amount))
+
+
+if __name__ == "__main__":
+    # Starting the parser for the command line arguments
+    parser = argparse.ArgumentParser()
+    parser.add_argument("target", help="the top level target directory")
+    parser.add_argument("--output", default=REPORT_FILE, help="the CSV file the report is written to")
+    parser.add_argument("--threads", type=int, default=THREADS, help="the number of headers that are read at once")
+    parser.add_argument("--index", default=corpus_index.INDEX_FILE, help="the file with the cached annotation index")
+    parser.add_argument("--no-index", action="store_true", help="always read the headers, without using the index")
+    parser.add_argument("--catalog", help="use the catalog saved in this file instead of scanning the target")
+    parser.add_argument("--verbose", action="store_true", help="print a line for every invalid recording")
+    args = parser.parse_args()
+
+    metrics.configure(verbose=args.verbose)
+    catalog = corpus_catalog.get_catalog(args.target, args.catalog)
+    results = validate(catalog.originals(), args.threads, None if args.no_index else args.index)
+    print_summary(results)
+    write_report(args.output, results)
+    metrics.log("Written the report to " + args.output)